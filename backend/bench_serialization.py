@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Per-row cost of serializing a product list: the original path (dict(row),
+# json.loads of specs, response_model validation, json.dumps) against the
+# RowEncoder path used by the list routes.
+#
+#   python bench_serialization.py [rows] [repeats]
+
+import json
+import sqlite3
+import sys
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+
+import server
+
+
+def make_rows(count: int):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    # One column per Product field, so the table keeps up with the model;
+    # fields without a sample value below are NULL
+    fields = server.PRODUCT_FIELDS
+    conn.execute(f'CREATE TABLE products ({", ".join(fields)})')
+    specs = json.dumps({'Power': '2000W', 'Features': 'Auto shutoff', 'Warranty': '2 years', 'Color': 'White'})
+    samples = ({
+        'id': i, 'name': f'Room Heater {i}', 'description': 'Powerful room heater for winter', 'price': 6500.0 + i,
+        'category_id': i % 6 + 1, 'image_url': f'https://images.example.com/{i}.jpg', 'specs': specs,
+        'stock': 15, 'is_featured': i % 2, 'created_at': '2025-10-28T04:39:52.089953+00:00', 'sku': f'RH-{i:05d}',
+    } for i in range(1, count + 1))
+    conn.executemany(
+        f'INSERT INTO products VALUES ({", ".join("?" * len(fields))})',
+        [tuple(sample.get(field) for field in fields) for sample in samples]
+    )
+    return conn.execute(f'SELECT {server.product_columns(None)} FROM products').fetchall()
+
+
+def legacy(rows, adapter) -> bytes:
+    products = [dict(row) for row in rows]
+    for p in products:
+        if p['specs']:
+            p['specs'] = json.loads(p['specs'])
+    # What FastAPI does with response_model=List[Product] and a JSONResponse
+    content = adapter.dump_python(adapter.validate_python(products), mode='json')
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def fast(rows, adapter) -> bytes:
+    return server.PRODUCT_ENCODER.encode_list(rows)
+
+
+def bench(fn, rows, adapter, repeats: int) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(rows, adapter)
+        best = min(best, time.perf_counter() - started)
+    return best / len(rows) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rows = make_rows(count)
+    adapter = TypeAdapter(List[server.Product])
+
+    assert json.loads(legacy(rows, adapter)) == json.loads(fast(rows, adapter))
+
+    before = bench(legacy, rows, adapter, repeats)
+    after = bench(fast, rows, adapter, repeats)
+    print(f'{count} rows, best of {repeats}, json encoder: {"orjson" if server.orjson else "json"}')
+    print(f'  response_model path: {before:8.2f} us/row')
+    print(f'  RowEncoder path:     {after:8.2f} us/row  ({before / after:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
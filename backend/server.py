@@ -1,203 +1,1165 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from starlette.datastructures import MutableHeaders
 from starlette.middleware.cors import CORSMiddleware
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field, TypeAdapter, ValidationError
+from typing import Dict, List, Optional
 from datetime import datetime, timezone, timedelta
 import sqlite3
 import jwt
 import bcrypt
 import json
+import math
+import csv
+import io
+import mimetypes
+import zlib
+import re
+import sys
+import argparse
 import base64
+import bisect
+import functools
+import hashlib
+import secrets
+import shutil
+import signal
+import tempfile
+import asyncio
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    import orjson
+except ImportError:  # optional, json is used as a fallback
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, responses are gzipped only
+    brotli = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional, uploads are stored without resized variants
+    Image = ImageOps = None
+
+try:
+    import fcntl
+except ImportError:  # POSIX only; elsewhere the server runs a single process
+    fcntl = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Server processes: `python server.py` runs this many workers on one port.
+# The per-process pools below split the cores between them by default.
+WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+# Seconds a stopping or replaced worker gets to finish in-flight requests
+GRACEFUL_SHUTDOWN_TIMEOUT = float(os.environ.get('GRACEFUL_SHUTDOWN_TIMEOUT', 30))
+
 # Database setup
-DB_PATH = ROOT_DIR / 'baaje_electronics.db'
+DB_PATH = Path(os.environ.get('DB_PATH', ROOT_DIR / 'baaje_electronics.db'))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+DB_CACHED_STATEMENTS = int(os.environ.get('DB_CACHED_STATEMENTS', 256))
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
+ADMIN_EMAIL = 'admin@baajeelectronics.com'
+# How often the in-memory list of admin ids is reloaded; demoting an admin
+# takes effect within this many seconds
+ADMIN_ROSTER_REFRESH = float(os.environ.get('ADMIN_ROSTER_REFRESH', 30))
+# An admin token the roster doesn't know (e.g. the admin was just created by
+# another worker) reloads it, at most this often
+ADMIN_ROSTER_MISS_INTERVAL = 1.0
+# Verified tokens remembered per process (0 disables)
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', 10000))
 
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
+# Password hashing pool
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2 // WEB_CONCURRENCY)))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+
+# Fail startup when a hot query plans as a full table scan: strict | warn | off
+QUERY_PLAN_AUDIT = os.environ.get('QUERY_PLAN_AUDIT', 'strict')
+
+# Per-request SQL profiling: off | on (X-Query-Count and Server-Timing
+# headers, slow and repeated statements logged) | all (also logs every
+# statement of every request)
+SQL_PROFILE = os.environ.get('SQL_PROFILE', 'off')
+# Statements slower than this are logged with their query plan
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+# A statement run this many times by one request is logged as a likely N+1
+SQL_REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD', 5))
+
+# Prometheus metrics at /metrics; with a token set, scrapers must send it as
+# a bearer token
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Upper edges (seconds) of the latency histogram buckets
+METRICS_BUCKETS = tuple(float(edge) for edge in os.environ.get(
+    'METRICS_BUCKETS', '0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10').split(','))
+# Directory where each worker process publishes its metrics for the others
+# to merge into a scrape; the multi-worker launcher picks a temporary one
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+# Catalog response cache
+CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', 512))
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', 300))
+# How often each worker checks the database for catalog changes made by others
+CATALOG_SYNC_INTERVAL = float(os.environ.get('CATALOG_SYNC_INTERVAL', 0.1))
+# Featured products included in the /api/storefront snapshot
+STOREFRONT_FEATURED_LIMIT = int(os.environ.get('STOREFRONT_FEATURED_LIMIT', 12))
+
+# HTTP caching of catalog responses. ETags are built from the shared catalog
+# versions, so every worker agrees on them; the build id keeps ETags from
+# different versions of this file (and so of the response shapes) apart.
+# Browsers keep catalog responses but revalidate every use: the ETag makes
+# that a 304 while nothing changed, and an admin's edit shows on the next
+# load instead of after a max-age (or stale-while-revalidate) window
+CACHE_CONTROL = {
+    'products': 'public, no-cache',
+    'product': 'public, no-cache',
+    'categories': 'public, no-cache',
+    'banners': 'public, no-cache',
+    'about': 'public, no-cache',
+    'storefront': 'public, no-cache',
+}
+BUILD_ID = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=4).hexdigest()
+
+# Upper edges of the price facet buckets (NPR); the last bucket is open-ended
+PRICE_BUCKETS = [float(edge) for edge in os.environ.get('PRICE_BUCKETS', '500,1000,2500,5000,10000').split(',')]
+
+# Response compression
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+COMPRESSIBLE_TYPES = set(os.environ.get(
+    'COMPRESSIBLE_TYPES',
+    'application/json,application/x-ndjson,text/csv,text/html,text/css,text/plain,text/javascript,'
+    'application/javascript,image/svg+xml',
+).split(','))
+
+# Image uploads: originals and their WebP variants live under UPLOAD_DIR,
+# named by the SHA-256 of the original
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', ROOT_DIR / 'uploads'))
+IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', max(1, (os.cpu_count() or 2) // 2 // WEB_CONCURRENCY)))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+# name:width pairs; each variant is scaled down to that width, never up
+IMAGE_VARIANTS = {
+    name: int(width)
+    for name, width in (pair.split(':') for pair in os.environ.get('IMAGE_VARIANTS', 'thumb:160,card:480,banner:1600').split(','))
+}
+# Prefix for the image URLs handed back by the upload route, e.g.
+# https://api.example.com; defaults to the host the upload came in on
+IMAGE_BASE_URL = os.environ.get('IMAGE_BASE_URL', '').rstrip('/')
+
+# Serve the React build (frontend/build) from this app as well, for
+# single-process deployments; empty leaves static hosting to someone else
+FRONTEND_BUILD_DIR = os.environ.get('FRONTEND_BUILD_DIR', '')
+# Files up to this size are held in memory, larger ones are sent from disk
+FRONTEND_INLINE_MAX = int(os.environ.get('FRONTEND_INLINE_MAX', 1024 * 1024))
+
+# Pagination
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 200))
+
+# Bulk product import: rows upserted per write transaction, and the most
+# per-row errors reported back
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 1000))
+
+# Rows fetched per read by the streaming order export
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 500))
+
 # Get the port from environment variable for Railway deployment
 PORT = int(os.environ.get("PORT", 8000))
 HOST = os.environ.get("HOST", "0.0.0.0")
 
-# Database context manager
+# Metrics
+# Counters and histograms are kept per thread and only summed when /metrics
+# is scraped, so recording one is a couple of dict operations with no lock:
+# requests are recorded on the event loop thread, database calls on the db
+# threads that make them. Figures that objects already keep (pool, caches)
+# are read by collectors at scrape time instead. With METRICS_DIR set every
+# process also writes its totals there, and a scrape adds up the files of the
+# other processes: counters of workers that have exited are kept so totals
+# never go backwards, their gauges are dropped.
+class Metrics:
+    def __init__(self, buckets: tuple = METRICS_BUCKETS, directory: str = METRICS_DIR,
+                 interval: float = METRICS_FLUSH_INTERVAL):
+        self.buckets = buckets
+        self.directory = Path(directory) if directory else None
+        self.interval = interval
+        self.families = {}
+        self.collectors = []
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._task = None
+
+    def counter(self, name: str, description: str, labels: tuple = ()):
+        self.families[name] = ('counter', description, labels)
+
+    def gauge(self, name: str, description: str, labels: tuple = ()):
+        self.families[name] = ('gauge', description, labels)
+
+    def histogram(self, name: str, description: str, labels: tuple = ()):
+        self.families[name] = ('histogram', description, labels)
+
+    # fn() returns (name, labels, value) triples, read on every scrape
+    def collector(self, fn):
+        self.collectors.append(fn)
+        return fn
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name: str, labels: tuple = (), amount: float = 1):
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name: str, labels: tuple, value: float):
+        # One count per bucket (the last one past every edge), then the sum
+        shard = self._shard()
+        key = (name, labels)
+        series = shard.get(key)
+        if series is None:
+            series = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @staticmethod
+    def _add(values: dict, key: tuple, value):
+        current = values.get(key)
+        if current is None:
+            values[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            values[key] = [a + b for a, b in zip(current, value)]
+        else:
+            values[key] = current + value
+
+    def snapshot(self) -> dict:
+        values = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # dict.copy() is atomic, so an owner adding a series can't break it
+            for key, value in shard.copy().items():
+                self._add(values, key, value)
+        for collect in self.collectors:
+            for name, labels, value in collect():
+                self._add(values, (name, labels), value)
+        return values
+
+    def _path(self, pid: int) -> Path:
+        return self.directory / f'{pid}.json'
+
+    def flush(self):
+        if self.directory is not None:
+            samples = [[name, list(labels), value] for (name, labels), value in self.snapshot().items()]
+            write_file_atomic(self._path(os.getpid()), json.dumps(samples).encode('utf-8'))
+
+    def merged(self) -> dict:
+        values = self.snapshot()
+        if self.directory is None:
+            return values
+        for path in self.directory.glob('*.json'):
+            pid = int(path.stem)
+            if pid == os.getpid():
+                continue
+            try:
+                samples = json.loads(path.read_bytes())
+            except (OSError, ValueError):
+                continue
+            alive = process_alive(pid)
+            for name, labels, value in samples:
+                family = self.families.get(name)
+                if family is not None and (alive or family[0] != 'gauge'):
+                    self._add(values, (name, tuple(labels)), value)
+        return values
+
+    @staticmethod
+    def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+        pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self) -> str:
+        series = {}
+        for (name, labels), value in self.merged().items():
+            series.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, (kind, description, label_names) in self.families.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(series.get(name, ()), key=lambda item: item[0]):
+                if kind != 'histogram':
+                    lines.append(f'{name}{self._labels(label_names, labels)} {value}')
+                    continue
+                cumulative = 0
+                for edge, count in zip(self.buckets + (float('inf'),), value):
+                    cumulative += count
+                    le = 'le="+Inf"' if edge == float('inf') else f'le="{edge:g}"'
+                    lines.append(f'{name}_bucket{self._labels(label_names, labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{self._labels(label_names, labels)} {value[-1]}')
+                lines.append(f'{name}_count{self._labels(label_names, labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError:
+                logging.exception('Failed to write metrics to %s', self.directory)
+
+    def start(self):
+        if self.directory is not None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.flush()
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+metrics = Metrics()
+metrics.gauge('http_requests_in_flight', 'Requests being served')
+metrics.counter('http_requests_total', 'Requests served, by route template and status', ('method', 'route', 'status'))
+metrics.histogram('http_request_duration_seconds', 'Time from receiving a request to sending the last byte of its response',
+                  ('method', 'route'))
+metrics.histogram('db_wait_seconds', 'Time a database call waited for a thread and a connection', ('lane',))
+metrics.histogram('db_query_duration_seconds', 'Time spent in a database call, by the function making it',
+                  ('lane', 'query'))
+metrics.counter('db_query_errors_total', 'Database calls that failed with an SQLite error', ('lane', 'query'))
+
+# Database connection pool
+# Connections are opened lazily up to `size` and reused across requests, so the
+# parsed schema, page cache and prepared statement cache survive between calls
+# to get_db() instead of being rebuilt every time.
+class ConnectionPool:
+    def __init__(self, path: Path, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._closed = False
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            str(self.path),
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=DB_CACHED_STATEMENTS,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Connection pool is closed')
+            if self._opened < self.size:
+                self._opened += 1
+                grow = True
+            else:
+                grow = False
+
+        if grow:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError(f'Timed out after {self.timeout}s waiting for a database connection')
+        finally:
+            waited = time.perf_counter() - started
+            with self._lock:
+                self._waits += 1
+                self._wait_time += waited
+                self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def _release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            try:
+                self._release(conn)
+            except sqlite3.Error:
+                # A connection that can't be rolled back is not safe to reuse
+                logging.exception('Discarding broken database connection')
+                conn.close()
+                with self._lock:
+                    self._opened -= 1
+
+    # All writes go through one dedicated connection so they serialize on our
+    # side instead of contending for SQLite's write lock with each other.
+    @contextmanager
+    def writer(self):
+        with self._writer_lock:
+            if self._closed:
+                raise RuntimeError('Connection pool is closed')
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': self.size,
+                'opened': self._opened,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time_total': round(self._wait_time, 6),
+                'wait_time_max': round(self._max_wait, 6),
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+db_pool = ConnectionPool(DB_PATH)
+
+# Database context managers
 @contextmanager
 def get_db():
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    try:
+    with db_pool.connection() as conn:
         yield conn
+
+@contextmanager
+def get_write_db():
+    with db_pool.writer() as conn:
+        yield conn
+
+# Query profiling
+# With SQL_PROFILE on, each request gets a QueryProfile (in a context
+# variable, picked up by db_read/db_write on the event loop) and the
+# connection handed to its data-access functions is wrapped so every
+# statement is recorded: its SQL, the shape of its parameters (types or
+# names only, never values), rows fetched or changed, and time spent in
+# execute and in fetching. Slow statements are explained on the same
+# connection before it goes back to the pool. With it off the only cost is
+# one context variable lookup per database call.
+class QueryRecord:
+    __slots__ = ('sql', 'params', 'rows', 'duration')
+
+    def __init__(self, sql: str, params):
+        self.sql = sql
+        self.params = params
+        self.rows = 0
+        self.duration = 0.0
+
+    # 'many' for executemany, whose parameter rows are not kept (params is None)
+    def shape(self) -> str:
+        if self.params is None:
+            return 'many'
+        if isinstance(self.params, dict):
+            return '{' + ', '.join(self.params) + '}'
+        return '(' + ', '.join(type(value).__name__ for value in self.params) + ')'
+
+class QueryProfile:
+    def __init__(self, label: str):
+        self.label = label
+        self.records = []
+
+    @property
+    def duration(self) -> float:
+        return sum(record.duration for record in self.records)
+
+    def explain_slow(self, conn: sqlite3.Connection, first: int):
+        for record in self.records[first:]:
+            if record.duration * 1000 < SLOW_QUERY_MS:
+                continue
+            try:
+                plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + record.sql, record.params or ())]
+            except sqlite3.Error as e:
+                plan = [f'(no plan: {e})']
+            logging.warning('Slow query in %s: %.1f ms, %d rows, params %s\n    %s\n    %s', self.label,
+                            record.duration * 1000, record.rows, record.shape(), ' '.join(record.sql.split()),
+                            '\n    '.join(plan))
+
+    def report(self):
+        if SQL_PROFILE == 'all':
+            for record in self.records:
+                logging.info('SQL %s: %.2f ms, %d rows, params %s: %s', self.label, record.duration * 1000,
+                             record.rows, record.shape(), ' '.join(record.sql.split()))
+        runs = {}
+        for record in self.records:
+            runs.setdefault(record.sql, []).append(record)
+        for sql, records in runs.items():
+            if len(records) >= SQL_REPEAT_THRESHOLD:
+                identical = len(records) - len({repr(record.params) for record in records})
+                logging.warning('Repeated query in %s: run %d times (%d with identical parameters), %.1f ms in '
+                                'total; likely N+1\n    %s', self.label, len(records), identical,
+                                sum(record.duration for record in records) * 1000, ' '.join(sql.split()))
+
+query_profile: ContextVar[Optional[QueryProfile]] = ContextVar('query_profile', default=None)
+
+class ProfiledCursor:
+    def __init__(self, cursor: sqlite3.Cursor, profile: QueryProfile):
+        self._cursor = cursor
+        self._profile = profile
+        self._record = None
+
+    def _run(self, method, sql: str, params, many: bool = False):
+        record = self._record = QueryRecord(sql, None if many else params)
+        self._profile.records.append(record)
+        started = time.perf_counter()
+        try:
+            method(sql, params)
+        finally:
+            record.duration += time.perf_counter() - started
+        if self._cursor.description is None:
+            record.rows = max(self._cursor.rowcount, 0)
+        return self
+
+    def execute(self, sql: str, params=()):
+        return self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql: str, seq_of_params):
+        return self._run(self._cursor.executemany, sql, seq_of_params, many=True)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._record is not None:
+                self._record.duration += time.perf_counter() - started
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is not None and self._record is not None:
+            self._record.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._fetch(self._cursor.fetchmany, *args)
+        if self._record is not None:
+            self._record.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        if self._record is not None:
+            self._record.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class ProfiledConnection:
+    def __init__(self, conn: sqlite3.Connection, profile: QueryProfile):
+        self._conn = conn
+        self._profile = profile
+
+    def cursor(self) -> ProfiledCursor:
+        return ProfiledCursor(self._conn.cursor(), self._profile)
+
+    def execute(self, sql: str, params=()) -> ProfiledCursor:
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params) -> ProfiledCursor:
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+# Async data access
+# Handlers never touch sqlite3 on the event loop: reads run on a thread pool
+# sized to the connection pool, writes on a single-thread lane that owns the
+# writer connection, so a slow query or a write lock only ties up a worker
+# thread instead of every in-flight request.
+db_read_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix='db-read')
+db_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-write')
+
+# Calls are timed per function (get_products.query, ...), which names the
+# statement(s) it runs at a cardinality the metrics can afford. The wait is
+# counted from submission, so it includes queueing for an executor thread.
+def _timed_call(lane: str, fn, conn, args, submitted: float, profile: Optional[QueryProfile]):
+    started = time.perf_counter()
+    metrics.observe('db_wait_seconds', (lane,), started - submitted)
+    query = fn.__qualname__.replace('.<locals>', '')
+    if profile is not None:
+        first = len(profile.records)
+        target = ProfiledConnection(conn, profile)
+    else:
+        target = conn
+    try:
+        return fn(target, *args)
+    except sqlite3.Error:
+        metrics.inc('db_query_errors_total', (lane, query))
+        raise
     finally:
-        conn.close()
+        metrics.observe('db_query_duration_seconds', (lane, query), time.perf_counter() - started)
+        if profile is not None:
+            profile.explain_slow(conn, first)
 
-# Initialize database
-def init_db():
+def _run_read(fn, args, submitted, profile):
     with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT,
-                name TEXT NOT NULL,
-                profile_picture TEXT,
-                auth_provider TEXT DEFAULT 'email',
-                created_at TEXT NOT NULL
-            )
-        ''')
-        
-        # Categories table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS categories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                image_url TEXT,
-                created_at TEXT NOT NULL
-            )
-        ''')
-        
-        # Products table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                price REAL NOT NULL,
-                category_id INTEGER,
-                image_url TEXT,
-                specs TEXT,
-                stock INTEGER DEFAULT 0,
-                is_featured BOOLEAN DEFAULT 0,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (category_id) REFERENCES categories (id)
-            )
-        ''')
-        
-        # Banners table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS banners (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                image_url TEXT NOT NULL,
-                link TEXT,
-                is_active BOOLEAN DEFAULT 1,
-                order_index INTEGER DEFAULT 0,
-                created_at TEXT NOT NULL
-            )
-        ''')
-        
-        # Orders table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                customer_name TEXT NOT NULL,
-                customer_email TEXT NOT NULL,
-                customer_phone TEXT NOT NULL,
-                customer_location TEXT NOT NULL,
-                items TEXT NOT NULL,
-                total_amount REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Favorites table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS favorites (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                product_id INTEGER NOT NULL,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (product_id) REFERENCES products (id),
-                UNIQUE(user_id, product_id)
-            )
-        ''')
-        
-        # About Us table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS about_us (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                content TEXT NOT NULL,
-                image_url TEXT,
-                updated_at TEXT NOT NULL
-            )
-        ''')
-        
+        return _timed_call('read', fn, conn, args, submitted, profile)
+
+def _run_write(fn, args, submitted, profile):
+    with get_write_db() as conn:
+        return _timed_call('write', fn, conn, args, submitted, profile)
+
+async def db_read(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_read_executor, _run_read, fn, args, time.perf_counter(), query_profile.get())
+
+async def db_write(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_write_executor, _run_write, fn, args, time.perf_counter(), query_profile.get())
+
+# Secondary indexes
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_products_created ON products (created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_products_price ON products (price, id)',
+    'CREATE INDEX IF NOT EXISTS idx_products_name ON products (name, id)',
+    'CREATE INDEX IF NOT EXISTS idx_products_category_created ON products (category_id, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_products_category_price ON products (category_id, price, id)',
+    'CREATE INDEX IF NOT EXISTS idx_products_category_name ON products (category_id, name, id)',
+    'CREATE INDEX IF NOT EXISTS idx_products_featured_created ON products (is_featured, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_products_featured_price ON products (is_featured, price, id)',
+    'CREATE INDEX IF NOT EXISTS idx_products_featured_name ON products (is_featured, name, id)',
+    'CREATE INDEX IF NOT EXISTS idx_categories_name ON categories (name)',
+    'CREATE INDEX IF NOT EXISTS idx_banners_active_order ON banners (is_active, order_index)',
+    'CREATE INDEX IF NOT EXISTS idx_banners_order ON banners (order_index)',
+    'CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_orders_customer_created ON orders (customer_email, created_at, id)',
+    # Covers the favorites side of the favorites listing join entirely
+    'CREATE INDEX IF NOT EXISTS idx_favorites_user_created ON favorites (user_id, created_at, id, product_id)',
+]
+
+# Product search
+# products_fts is a standalone FTS5 index keyed by product id. Triggers on
+# products and categories keep it in step with every write, so the search
+# route only ever reads it; rebuild_search_index() repopulates it from
+# scratch for databases that predate it or after a bulk repair.
+SEARCH_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, category, specs,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, description, category, specs)
+        VALUES (NEW.id, NEW.name, COALESCE(NEW.description, ''),
+                COALESCE((SELECT name FROM categories WHERE id = NEW.category_id), ''),
+                COALESCE((SELECT group_concat(value, ' ') FROM json_each(CASE WHEN json_valid(NEW.specs) THEN NEW.specs END)), ''));
+    END''',
+    # Only the indexed columns; price and stock updates leave the index alone.
+    # Replaces the catch-all trigger of databases that had the index early.
+    'DROP TRIGGER IF EXISTS products_fts_update',
+    '''CREATE TRIGGER products_fts_update AFTER UPDATE OF name, description, category_id, specs ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = OLD.id;
+        INSERT INTO products_fts (rowid, name, description, category, specs)
+        VALUES (NEW.id, NEW.name, COALESCE(NEW.description, ''),
+                COALESCE((SELECT name FROM categories WHERE id = NEW.category_id), ''),
+                COALESCE((SELECT group_concat(value, ' ') FROM json_each(CASE WHEN json_valid(NEW.specs) THEN NEW.specs END)), ''));
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = OLD.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS products_fts_category_rename AFTER UPDATE OF name ON categories BEGIN
+        UPDATE products_fts SET category = NEW.name
+        WHERE rowid IN (SELECT id FROM products WHERE category_id = NEW.id);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS products_fts_category_delete AFTER DELETE ON categories BEGIN
+        UPDATE products_fts SET category = ''
+        WHERE rowid IN (SELECT id FROM products WHERE category_id = OLD.id);
+    END''',
+]
+
+# Rebuilt one id range at a time and merged in small steps instead of one
+# long 'optimize', so the write lock is never held for more than a chunk
+def rebuild_search_index(conn) -> int:
+    last = in_chunks(conn, 'products', 'DELETE FROM products_fts WHERE rowid > :low AND rowid <= :high', '''
+        INSERT INTO products_fts (rowid, name, description, category, specs)
+        SELECT p.id, p.name, COALESCE(p.description, ''), COALESCE(c.name, ''),
+               COALESCE((SELECT group_concat(value, ' ') FROM json_each(CASE WHEN json_valid(p.specs) THEN p.specs END)), '')
+        FROM products p LEFT JOIN categories c ON c.id = p.category_id
+        WHERE p.id > :low AND p.id <= :high
+    ''')
+    conn.execute('DELETE FROM products_fts WHERE rowid > ?', (last,))
+    conn.commit()
+    while True:
+        # Fewer than two changes means there was nothing left to merge
+        before = conn.total_changes
+        conn.execute("INSERT INTO products_fts (products_fts, rank) VALUES ('merge', 500)")
         conn.commit()
-        
-        # Add sample data
-        cursor.execute('SELECT COUNT(*) as count FROM categories')
-        if cursor.fetchone()['count'] == 0:
-            # Sample categories
-            categories = [
-                ('Fans', 'https://images.unsplash.com/photo-1607400201889-565b1ee75f8e?w=400'),
-                ('Lights', 'https://images.unsplash.com/photo-1513506003901-1e6a229e2d15?w=400'),
-                ('Heaters', 'https://images.unsplash.com/photo-1545259742-25a6d78aeffc?w=400'),
-                ('Wires & Cables', 'https://images.unsplash.com/photo-1473186578172-c141e6798cf4?w=400'),
-                ('Switches', 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=400'),
-                ('Home Appliances', 'https://images.unsplash.com/photo-1556911220-bff31c812dba?w=400')
-            ]
-            now = datetime.now(timezone.utc).isoformat()
-            cursor.executemany('INSERT INTO categories (name, image_url, created_at) VALUES (?, ?, ?)',
-                             [(cat[0], cat[1], now) for cat in categories])
-            
-            # Sample products
-            products = [
-                ('Ceiling Fan Deluxe', 'High-speed ceiling fan with remote control', 4500.0, 1, 'https://images.unsplash.com/photo-1607400201515-c2c41c07e14c?w=600', '{"Speed": "3 levels", "Size": "48 inch", "Warranty": "2 years"}', 25, 1),
-                ('Table Fan Pro', 'Portable table fan with oscillation', 2200.0, 1, 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=600', '{"Speed": "3 levels", "Size": "16 inch", "Warranty": "1 year"}', 40, 1),
-                ('LED Bulb 12W', 'Energy efficient LED bulb', 350.0, 2, 'https://images.unsplash.com/photo-1524484485831-a92ffc0de03f?w=600', '{"Power": "12W", "Color": "Cool White", "Warranty": "1 year"}', 100, 0),
-                ('Smart LED Strip', 'RGB LED strip with app control', 1800.0, 2, 'https://images.unsplash.com/photo-1513506003901-1e6a229e2d15?w=600', '{"Length": "5 meters", "Control": "App & Remote", "Warranty": "1 year"}', 30, 1),
-                ('Room Heater 2000W', 'Powerful room heater for winter', 6500.0, 3, 'https://images.unsplash.com/photo-1545259742-25a6d78aeffc?w=600', '{"Power": "2000W", "Features": "Auto shutoff", "Warranty": "2 years"}', 15, 1),
-                ('Oil Heater', 'Silent oil-filled heater', 8900.0, 3, 'https://images.unsplash.com/photo-1603893185127-4cc0e48d2b0a?w=600', '{"Power": "2500W", "Features": "Silent operation", "Warranty": "2 years"}', 10, 0),
-                ('Copper Wire 2.5mm', 'Premium quality copper wire', 850.0, 4, 'https://images.unsplash.com/photo-1473186578172-c141e6798cf4?w=600', '{"Size": "2.5mm", "Length": "90 meters", "Material": "Pure Copper"}', 50, 0),
-                ('HDMI Cable 2m', 'High-speed HDMI cable', 450.0, 4, 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=600', '{"Length": "2 meters", "Version": "HDMI 2.0", "Warranty": "6 months"}', 80, 0),
-                ('Modular Switch White', '2-way modular switch', 280.0, 5, 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=600', '{"Type": "2-way", "Color": "White", "Warranty": "1 year"}', 150, 0),
-                ('Smart Switch', 'WiFi enabled smart switch', 1200.0, 5, 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=600', '{"Type": "Smart WiFi", "Control": "App & Voice", "Warranty": "1 year"}', 35, 1),
-                ('Microwave Oven', '20L microwave oven', 9500.0, 6, 'https://images.unsplash.com/photo-1585659722983-3a675dabf23d?w=600', '{"Capacity": "20L", "Power": "800W", "Warranty": "1 year"}', 12, 1),
-                ('Electric Kettle', '1.8L electric kettle', 1800.0, 6, 'https://images.unsplash.com/photo-1556911220-bff31c812dba?w=600', '{"Capacity": "1.8L", "Material": "Stainless Steel", "Warranty": "1 year"}', 45, 0)
-            ]
-            
-            cursor.executemany(
-                'INSERT INTO products (name, description, price, category_id, image_url, specs, stock, is_featured, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                [(p[0], p[1], p[2], p[3], p[4], p[5], p[6], p[7], now) for p in products]
-            )
-            
-            # Sample banners
-            banners = [
-                ('Winter Sale - Up to 50% Off!', 'https://images.unsplash.com/photo-1607082348824-0a96f2a4b9da?w=1200', None, 1, 0),
-                ('New Arrivals - Smart Home Devices', 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=1200', None, 1, 1),
-                ('Premium Fans - Beat the Heat', 'https://images.unsplash.com/photo-1607400201515-c2c41c07e14c?w=1200', None, 1, 2)
-            ]
-            cursor.executemany(
-                'INSERT INTO banners (title, image_url, link, is_active, order_index, created_at) VALUES (?, ?, ?, ?, ?, ?)',
-                [(b[0], b[1], b[2], b[3], b[4], now) for b in banners]
-            )
-            
-            # Sample About Us
-            about_content = '''Baaje Electronics has been serving Buddhanagar, Kathmandu since 2010. We are your trusted partner for all electronics needs, offering quality products at competitive prices. Our commitment to customer satisfaction and after-sales service has made us a household name in the community.'''
-            cursor.execute(
-                'INSERT INTO about_us (content, image_url, updated_at) VALUES (?, ?, ?)',
-                (about_content, 'https://images.unsplash.com/photo-1556911220-bff31c812dba?w=800', now)
-            )
-            
+        if conn.total_changes - before < 2:
+            break
+    return conn.execute('SELECT COUNT(*) FROM products_fts').fetchone()[0]
+
+# Spec facets
+# product_specs holds one row per scalar key/value of products.specs, kept in
+# step by triggers, so spec filters and facet counts are index lookups
+# instead of a json.loads of every row on every request.
+SPEC_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS product_specs (
+        product_id INTEGER NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (product_id, key)
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS idx_product_specs_key_value ON product_specs (key, value, product_id)',
+    '''CREATE TRIGGER IF NOT EXISTS product_specs_insert AFTER INSERT ON products BEGIN
+        INSERT OR REPLACE INTO product_specs (product_id, key, value)
+        SELECT NEW.id, key, CAST(value AS TEXT)
+        FROM json_each(CASE WHEN json_valid(NEW.specs) THEN NEW.specs END)
+        WHERE type NOT IN ('object', 'array', 'null');
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS product_specs_update AFTER UPDATE OF specs ON products BEGIN
+        DELETE FROM product_specs WHERE product_id = OLD.id;
+        INSERT OR REPLACE INTO product_specs (product_id, key, value)
+        SELECT NEW.id, key, CAST(value AS TEXT)
+        FROM json_each(CASE WHEN json_valid(NEW.specs) THEN NEW.specs END)
+        WHERE type NOT IN ('object', 'array', 'null');
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS product_specs_delete AFTER DELETE ON products BEGIN
+        DELETE FROM product_specs WHERE product_id = OLD.id;
+    END''',
+]
+
+def rebuild_spec_index(conn) -> int:
+    last = in_chunks(conn, 'products', 'DELETE FROM product_specs WHERE product_id > :low AND product_id <= :high', '''
+        INSERT OR REPLACE INTO product_specs (product_id, key, value)
+        SELECT p.id, j.key, CAST(j.value AS TEXT)
+        FROM products p, json_each(CASE WHEN json_valid(p.specs) THEN p.specs END) j
+        WHERE p.id > :low AND p.id <= :high AND j.type NOT IN ('object', 'array', 'null')
+    ''')
+    conn.execute('DELETE FROM product_specs WHERE product_id > ?', (last,))
+    conn.commit()
+    return conn.execute('SELECT COUNT(*) FROM product_specs').fetchone()[0]
+
+# Catalog versions
+# One counter per cached catalog table, bumped by triggers in the same
+# transaction as the change. Every worker watches them (see CatalogSync) to
+# drop its own cached responses, and they are the version part of catalog
+# ETags, which therefore agree across workers and restarts.
+CATALOG_TAGS = ('products', 'categories', 'banners', 'about_us')
+# Every order decrements stock, so an update of stock alone leaves the version
+# alone: otherwise checkout traffic would empty the catalog caches of every
+# worker. Cached responses may show stock up to CATALOG_CACHE_TTL old; placing
+# an order always checks it live.
+CATALOG_PRODUCT_COLUMNS = 'name, description, price, category_id, image_url, specs, is_featured, sku'
+CATALOG_VERSION_EVENTS = {tag: {'insert': 'INSERT', 'update': 'UPDATE', 'delete': 'DELETE'} for tag in CATALOG_TAGS}
+CATALOG_VERSION_EVENTS['products']['update'] = f'UPDATE OF {CATALOG_PRODUCT_COLUMNS}'
+CATALOG_VERSION_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS catalog_version (
+        tag TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''',
+    *(f"INSERT OR IGNORE INTO catalog_version (tag) VALUES ('{tag}')" for tag in CATALOG_TAGS),
+    *(f'''CREATE TRIGGER IF NOT EXISTS catalog_version_{tag}_{name} AFTER {event} ON {tag} BEGIN
+        UPDATE catalog_version SET version = version + 1 WHERE tag = '{tag}';
+    END''' for tag, events in CATALOG_VERSION_EVENTS.items() for name, event in events.items()),
+]
+
+# Schema migrations
+# The schema is built by an ordered list of steps; schema_version records the
+# ones applied, so on a current database startup is a single version check.
+# Databases from before the table existed start at step 1: every step is
+# written to be a no-op on the parts that are already there. A step's DDL is
+# one transaction with its version row; its backfill, if any, runs after the
+# DDL in MIGRATION_CHUNK_SIZE id ranges, each committed on its own so other
+# writers get the lock in between, and is safe to re-run if interrupted.
+MIGRATION_CHUNK_SIZE = int(os.environ.get('MIGRATION_CHUNK_SIZE', 5000))
+# Pause after each chunk. A writer blocked on SQLite's busy timeout only
+# retries every 100ms, so a shorter gap would let the backfill take the lock
+# straight back every time.
+MIGRATION_CHUNK_PAUSE = float(os.environ.get('MIGRATION_CHUNK_PAUSE', 0.1))
+
+class Migration:
+    def __init__(self, version: int, description: str, statements=(), backfill=None):
+        self.version = version
+        self.description = description
+        # SQL strings, or callables taking the connection
+        self.statements = statements
+        self.backfill = backfill
+
+    def apply(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for statement in self.statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            if self.backfill is None:
+                self.record(conn)
             conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if self.backfill is not None:
+            self.backfill(conn)
+            conn.execute('BEGIN IMMEDIATE')
+            self.record(conn)
+            conn.commit()
+
+    def record(self, conn):
+        conn.execute(
+            'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+            (self.version, self.description, datetime.now(timezone.utc).isoformat())
+        )
+
+def add_column(table: str, column: str, definition: str, then: Optional[str] = None):
+    # ALTER TABLE ADD COLUMN has no IF NOT EXISTS; `then` runs only when the
+    # column is actually added
+    def statement(conn):
+        if column not in {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+            if then:
+                conn.execute(then)
+    return statement
+
+def in_chunks(conn, table: str, *statements: str, chunk_size: int = MIGRATION_CHUNK_SIZE) -> int:
+    # Runs `statements` once per id range of `table`, bound to :low and
+    # :high, one transaction per range; returns the highest id covered
+    last = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+    for low in range(0, last, chunk_size):
+        for sql in statements:
+            conn.execute(sql, {'low': low, 'high': low + chunk_size})
+        conn.commit()
+        time.sleep(MIGRATION_CHUNK_PAUSE)
+    return last
+
+BASE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT,
+        name TEXT NOT NULL,
+        profile_picture TEXT,
+        auth_provider TEXT DEFAULT 'email',
+        created_at TEXT NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        image_url TEXT,
+        created_at TEXT NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        price REAL NOT NULL,
+        category_id INTEGER,
+        image_url TEXT,
+        specs TEXT,
+        stock INTEGER DEFAULT 0,
+        is_featured BOOLEAN DEFAULT 0,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (category_id) REFERENCES categories (id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS banners (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        image_url TEXT NOT NULL,
+        link TEXT,
+        is_active BOOLEAN DEFAULT 1,
+        order_index INTEGER DEFAULT 0,
+        created_at TEXT NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        customer_name TEXT NOT NULL,
+        customer_email TEXT NOT NULL,
+        customer_phone TEXT NOT NULL,
+        customer_location TEXT NOT NULL,
+        items TEXT NOT NULL,
+        total_amount REAL NOT NULL,
+        status TEXT DEFAULT 'pending',
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS favorites (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (product_id) REFERENCES products (id),
+        UNIQUE(user_id, product_id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS about_us (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        content TEXT NOT NULL,
+        image_url TEXT,
+        updated_at TEXT NOT NULL
+    )''',
+]
+
+# Order lines, priced from products when the order is placed. orders.items
+# keeps the same lines as JSON for the existing order endpoints.
+ORDER_ITEMS_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        unit_price REAL NOT NULL,
+        quantity INTEGER NOT NULL,
+        FOREIGN KEY (order_id) REFERENCES orders (id),
+        FOREIGN KEY (product_id) REFERENCES products (id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)',
+    'CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items (product_id, order_id)',
+]
+
+def backfill_order_items(conn):
+    # Orders placed before order_items existed only have the JSON copy
+    in_chunks(conn, 'orders', '''
+        INSERT INTO order_items (order_id, product_id, name, unit_price, quantity)
+        SELECT o.id, json_extract(i.value, '$.id'), COALESCE(json_extract(i.value, '$.name'), ''),
+               COALESCE(json_extract(i.value, '$.price'), 0), json_extract(i.value, '$.quantity')
+        FROM orders o, json_each(CASE WHEN json_valid(o.items) THEN o.items ELSE '[]' END) i
+        WHERE o.id > :low AND o.id <= :high
+          AND NOT EXISTS (SELECT 1 FROM order_items WHERE order_id = o.id)
+          AND json_type(i.value, '$.id') = 'integer' AND json_type(i.value, '$.quantity') = 'integer'
+    ''')
+
+def seed_sample_data(conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) as count FROM categories')
+    if cursor.fetchone()['count'] == 0:
+        # Sample categories
+        categories = [
+            ('Fans', 'https://images.unsplash.com/photo-1607400201889-565b1ee75f8e?w=400'),
+            ('Lights', 'https://images.unsplash.com/photo-1513506003901-1e6a229e2d15?w=400'),
+            ('Heaters', 'https://images.unsplash.com/photo-1545259742-25a6d78aeffc?w=400'),
+            ('Wires & Cables', 'https://images.unsplash.com/photo-1473186578172-c141e6798cf4?w=400'),
+            ('Switches', 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=400'),
+            ('Home Appliances', 'https://images.unsplash.com/photo-1556911220-bff31c812dba?w=400')
+        ]
+        now = datetime.now(timezone.utc).isoformat()
+        cursor.executemany('INSERT INTO categories (name, image_url, created_at) VALUES (?, ?, ?)',
+                         [(cat[0], cat[1], now) for cat in categories])
+    
+        # Sample products
+        products = [
+            ('Ceiling Fan Deluxe', 'High-speed ceiling fan with remote control', 4500.0, 1, 'https://images.unsplash.com/photo-1607400201515-c2c41c07e14c?w=600', '{"Speed": "3 levels", "Size": "48 inch", "Warranty": "2 years"}', 25, 1),
+            ('Table Fan Pro', 'Portable table fan with oscillation', 2200.0, 1, 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=600', '{"Speed": "3 levels", "Size": "16 inch", "Warranty": "1 year"}', 40, 1),
+            ('LED Bulb 12W', 'Energy efficient LED bulb', 350.0, 2, 'https://images.unsplash.com/photo-1524484485831-a92ffc0de03f?w=600', '{"Power": "12W", "Color": "Cool White", "Warranty": "1 year"}', 100, 0),
+            ('Smart LED Strip', 'RGB LED strip with app control', 1800.0, 2, 'https://images.unsplash.com/photo-1513506003901-1e6a229e2d15?w=600', '{"Length": "5 meters", "Control": "App & Remote", "Warranty": "1 year"}', 30, 1),
+            ('Room Heater 2000W', 'Powerful room heater for winter', 6500.0, 3, 'https://images.unsplash.com/photo-1545259742-25a6d78aeffc?w=600', '{"Power": "2000W", "Features": "Auto shutoff", "Warranty": "2 years"}', 15, 1),
+            ('Oil Heater', 'Silent oil-filled heater', 8900.0, 3, 'https://images.unsplash.com/photo-1603893185127-4cc0e48d2b0a?w=600', '{"Power": "2500W", "Features": "Silent operation", "Warranty": "2 years"}', 10, 0),
+            ('Copper Wire 2.5mm', 'Premium quality copper wire', 850.0, 4, 'https://images.unsplash.com/photo-1473186578172-c141e6798cf4?w=600', '{"Size": "2.5mm", "Length": "90 meters", "Material": "Pure Copper"}', 50, 0),
+            ('HDMI Cable 2m', 'High-speed HDMI cable', 450.0, 4, 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=600', '{"Length": "2 meters", "Version": "HDMI 2.0", "Warranty": "6 months"}', 80, 0),
+            ('Modular Switch White', '2-way modular switch', 280.0, 5, 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=600', '{"Type": "2-way", "Color": "White", "Warranty": "1 year"}', 150, 0),
+            ('Smart Switch', 'WiFi enabled smart switch', 1200.0, 5, 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=600', '{"Type": "Smart WiFi", "Control": "App & Voice", "Warranty": "1 year"}', 35, 1),
+            ('Microwave Oven', '20L microwave oven', 9500.0, 6, 'https://images.unsplash.com/photo-1585659722983-3a675dabf23d?w=600', '{"Capacity": "20L", "Power": "800W", "Warranty": "1 year"}', 12, 1),
+            ('Electric Kettle', '1.8L electric kettle', 1800.0, 6, 'https://images.unsplash.com/photo-1556911220-bff31c812dba?w=600', '{"Capacity": "1.8L", "Material": "Stainless Steel", "Warranty": "1 year"}', 45, 0)
+        ]
+    
+        cursor.executemany(
+            'INSERT INTO products (name, description, price, category_id, image_url, specs, stock, is_featured, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(p[0], p[1], p[2], p[3], p[4], p[5], p[6], p[7], now) for p in products]
+        )
+    
+        # Sample banners
+        banners = [
+            ('Winter Sale - Up to 50% Off!', 'https://images.unsplash.com/photo-1607082348824-0a96f2a4b9da?w=1200', None, 1, 0),
+            ('New Arrivals - Smart Home Devices', 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=1200', None, 1, 1),
+            ('Premium Fans - Beat the Heat', 'https://images.unsplash.com/photo-1607400201515-c2c41c07e14c?w=1200', None, 1, 2)
+        ]
+        cursor.executemany(
+            'INSERT INTO banners (title, image_url, link, is_active, order_index, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            [(b[0], b[1], b[2], b[3], b[4], now) for b in banners]
+        )
+    
+        # Sample About Us
+        about_content = '''Baaje Electronics has been serving Buddhanagar, Kathmandu since 2010. We are your trusted partner for all electronics needs, offering quality products at competitive prices. Our commitment to customer satisfaction and after-sales service has made us a household name in the community.'''
+        cursor.execute(
+            'INSERT INTO about_us (content, image_url, updated_at) VALUES (?, ?, ?)',
+            (about_content, 'https://images.unsplash.com/photo-1556911220-bff31c812dba?w=800', now)
+        )
+
+MIGRATIONS = [
+    Migration(1, 'Base tables', BASE_SCHEMA),
+    # One index per real query shape. Product listings filter on nothing,
+    # category or featured flag and sort by any PRODUCT_SORTS key with id as
+    # the keyset tie-breaker.
+    Migration(2, 'Secondary indexes', INDEXES),
+    Migration(3, 'Product search index', SEARCH_SCHEMA, backfill=rebuild_search_index),
+    Migration(4, 'Product spec facets', SPEC_SCHEMA, backfill=rebuild_spec_index),
+    Migration(5, 'Order line items', ORDER_ITEMS_SCHEMA, backfill=backfill_order_items),
+    Migration(6, 'Product SKUs', [
+        add_column('products', 'sku', 'TEXT'),
+        # Bulk import upserts on sku; products created by hand may not have one
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products (sku) WHERE sku IS NOT NULL',
+    ]),
+    # The built-in admin account was recognised by its email before roles were
+    # stored, so it keeps its rights
+    Migration(7, 'Admin role', [
+        add_column('users', 'is_admin', 'BOOLEAN NOT NULL DEFAULT 0',
+                   then=f"UPDATE users SET is_admin = 1 WHERE email = '{ADMIN_EMAIL}'"),
+        'CREATE INDEX IF NOT EXISTS idx_users_admin ON users (id) WHERE is_admin = 1',
+    ]),
+    Migration(8, 'Catalog versions', CATALOG_VERSION_SCHEMA),
+    Migration(9, 'Sample data', [seed_sample_data]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+def schema_version(conn) -> int:
+    try:
+        return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+    except sqlite3.OperationalError:  # no schema_version table yet
+        return 0
+
+def pending_migrations(conn) -> List[Migration]:
+    current = schema_version(conn)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(f'Database schema version {current} is newer than this server ({SCHEMA_VERSION})')
+    return [m for m in MIGRATIONS if m.version > current]
+
+def migrate(conn) -> List[Migration]:
+    pending = pending_migrations(conn)
+    if pending:
+        conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )''')
+    for migration in pending:
+        started = time.perf_counter()
+        migration.apply(conn)
+        logging.info('Applied migration %d (%s) in %.2fs', migration.version, migration.description,
+                     time.perf_counter() - started)
+    return pending
+
+# Processes sharing the database file migrate it one at a time; whoever gets
+# the lock first does the work and the rest find nothing left to do. The
+# lock is released by the OS if its holder dies.
+@contextmanager
+def init_lock():
+    if fcntl is None:
+        yield
+        return
+    with open(f'{DB_PATH}.init-lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def prepare_database():
+    with init_lock(), get_write_db() as conn:
+        return migrate(conn)
 
 # Pydantic Models
 class UserSignup(BaseModel):
@@ -227,6 +1189,7 @@ class Product(BaseModel):
     stock: int
     is_featured: bool
     created_at: str
+    sku: Optional[str] = None
 
 class ProductCreate(BaseModel):
     name: str
@@ -237,6 +1200,40 @@ class ProductCreate(BaseModel):
     specs: Optional[dict] = None
     stock: int = 0
     is_featured: bool = False
+    sku: Optional[str] = None
+
+class ProductPatch(BaseModel):
+    id: int
+    price: Optional[float] = Field(None, ge=0)
+    stock: Optional[int] = Field(None, ge=0)
+    is_featured: Optional[bool] = None
+
+# One row of a bulk import; `category` is a category name, used when the
+# supplier file doesn't carry our category ids
+class ProductImportRow(ProductCreate):
+    sku: str = Field(min_length=1)
+    price: float = Field(ge=0)
+    stock: int = Field(0, ge=0)
+    category: Optional[str] = None
+
+class ProductSearchResult(Product):
+    score: float
+    highlighted_name: Optional[str] = None
+    snippet: Optional[str] = None
+
+class FacetValue(BaseModel):
+    value: str
+    count: int
+
+class PriceBucket(BaseModel):
+    min: Optional[float]
+    max: Optional[float]
+    count: int
+
+class ProductFacets(BaseModel):
+    total: int
+    specs: Dict[str, List[FacetValue]]
+    price_buckets: List[PriceBucket]
 
 class Category(BaseModel):
     id: int
@@ -264,13 +1261,18 @@ class BannerCreate(BaseModel):
     is_active: bool = True
     order_index: int = 0
 
+class OrderItemCreate(BaseModel):
+    id: int
+    quantity: int = Field(ge=1)
+
 class OrderCreate(BaseModel):
     customer_name: str
     customer_email: EmailStr
     customer_phone: str
     customer_location: str
-    items: List[dict]
-    total_amount: float
+    items: List[OrderItemCreate] = Field(min_length=1)
+    # Ignored: prices and the total are worked out from products
+    total_amount: Optional[float] = None
 
 class Order(BaseModel):
     id: int
@@ -294,92 +1296,1372 @@ class AboutUsUpdate(BaseModel):
     content: str
     image_url: Optional[str] = None
 
+class Storefront(BaseModel):
+    banners: List[Banner]
+    categories: List[Category]
+    featured_products: List[Product]
+    about: Optional[AboutUs]
+
+# Serializers for cached responses, equivalent to FastAPI's response_model pass
+FACETS = TypeAdapter(ProductFacets)
+CATEGORY_LIST = TypeAdapter(List[Category])
+BANNER_LIST = TypeAdapter(List[Banner])
+ABOUT = TypeAdapter(AboutUs)
+OPTIONAL_ABOUT = TypeAdapter(Optional[AboutUs])
+
+# Password hashing
+# bcrypt is deliberately slow, so it runs in a bounded process pool where it
+# can use other cores without holding the GIL or the event loop. When more
+# than `max_pending` operations are already queued we shed load with a 503
+# rather than let a login burst starve the rest of the API.
+def _bcrypt_hash(password: bytes):
+    started = time.time()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt())
+    return hashed, started, time.time()
+
+def _bcrypt_check(password: bytes, hashed: bytes):
+    started = time.time()
+    matches = bcrypt.checkpw(password, hashed)
+    return matches, started, time.time()
+
+PASSWORD_HASH_OPERATIONS = {_bcrypt_hash: 'hash', _bcrypt_check: 'check'}
+
+metrics.histogram('password_hash_queue_seconds', 'Time a bcrypt operation waited for a hashing process', ('operation',))
+metrics.histogram('password_hash_duration_seconds', 'Time a hashing process spent on a bcrypt operation', ('operation',))
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        # Only touched from the event loop thread, so no locking is needed
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._queue_times = deque(maxlen=1024)
+        self._run_times = deque(maxlen=1024)
+
+    def start(self):
+        if self._executor is None:
+            # spawn rather than fork: the parent already runs database threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def _submit(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail='Too many authentication requests in progress, please retry shortly',
+                headers={'Retry-After': '1'},
+            )
+
+        self.start()
+        self._pending += 1
+        submitted = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started, finished = await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+        self._completed += 1
+        queue_time = max(0.0, started - submitted)
+        self._queue_times.append(queue_time)
+        self._run_times.append(finished - started)
+        operation = PASSWORD_HASH_OPERATIONS[fn]
+        metrics.observe('password_hash_queue_seconds', (operation,), queue_time)
+        metrics.observe('password_hash_duration_seconds', (operation,), finished - started)
+        return result
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._submit(_bcrypt_hash, password.encode('utf-8'))
+        return hashed.decode('utf-8')
+
+    async def check(self, password: str, hashed: Optional[str]) -> bool:
+        if not hashed:
+            return False
+        return await self._submit(_bcrypt_check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    @staticmethod
+    def _summary(samples) -> dict:
+        if not samples:
+            return {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+        ordered = sorted(samples)
+        return {
+            'p50': round(ordered[len(ordered) // 2], 6),
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 6),
+            'max': round(ordered[-1], 6),
+        }
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'pending': self._pending,
+            'completed': self._completed,
+            'rejected': self._rejected,
+            'queue_time': self._summary(self._queue_times),
+            'hash_time': self._summary(self._run_times),
+        }
+
+
+password_hasher = PasswordHasher()
+
+# Image variants
+# Uploads are stored once under the SHA-256 of their bytes, so a URL always
+# names the same content and can be cached forever. Resizing and WebP
+# encoding run in a process pool after the upload has been answered; until a
+# variant exists its URL serves the original (without the immutable header).
+IMAGE_TYPES = {
+    b'\xff\xd8\xff': 'jpg',
+    b'\x89PNG\r\n\x1a\n': 'png',
+    b'GIF87a': 'gif',
+    b'GIF89a': 'gif',
+}
+# WebP's signature is split around the file size, so sniff_image_type checks
+# it separately
+IMAGE_EXTENSIONS = {*IMAGE_TYPES.values(), 'webp'}
+
+def sniff_image_type(data: bytes) -> Optional[str]:
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    for magic, ext in IMAGE_TYPES.items():
+        if data.startswith(magic):
+            return ext
+    return None
+
+def image_dir(digest: str) -> Path:
+    return UPLOAD_DIR / 'images' / digest[:2] / digest
+
+def find_original(digest: str) -> Optional[Path]:
+    return next(image_dir(digest).glob('original.*'), None)
+
+def write_file_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{secrets.token_hex(4)}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+def _render_image_variants(source: str, variants: dict, quality: int):
+    started = time.time()
+    target = Path(source).parent
+    sizes = {}
+    with Image.open(source) as image:
+        # Lets the JPEG decoder scale down while decoding
+        image.draft('RGB', (max(variants.values()), max(variants.values())))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'P', 'PA') else 'RGB')
+        for name, width in sorted(variants.items(), key=lambda item: -item[1]):
+            variant = image
+            if image.width > width:
+                variant = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            path = target / f'{name}.webp'
+            tmp = target / f'.{name}.webp.tmp'
+            variant.save(tmp, 'WEBP', quality=quality, method=4)
+            os.replace(tmp, path)
+            sizes[name] = variant.size
+    return sizes, started, time.time()
+
+class ImageProcessor:
+    def __init__(self, workers: int = IMAGE_WORKERS, variants: dict = IMAGE_VARIANTS, quality: int = IMAGE_QUALITY):
+        self.workers = workers
+        self.variants = variants
+        self.quality = quality
+        self._executor = None
+        # Only touched from the event loop thread, so no locking is needed
+        self._pending = {}
+        self._failed_digests = set()
+        self._completed = 0
+        self._failed = 0
+        self._run_times = deque(maxlen=1024)
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None and bool(self.variants)
+
+    def start(self):
+        if self._executor is None and self.enabled:
+            # spawn rather than fork: the parent already runs database threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+
+    def shutdown(self):
+        for task in self._pending.values():
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def missing(self, digest: str) -> List[str]:
+        directory = image_dir(digest)
+        return [name for name in self.variants if not (directory / f'{name}.webp').is_file()]
+
+    def ensure(self, digest: str, original: Path):
+        # Queues the variants of an image unless they exist, are already being
+        # made, or the image could not be decoded before
+        if not self.enabled or digest in self._pending or digest in self._failed_digests:
+            return
+        if self.missing(digest):
+            self.start()
+            self._pending[digest] = asyncio.get_running_loop().create_task(self._render(digest, original))
+
+    async def _render(self, digest: str, original: Path):
+        loop = asyncio.get_running_loop()
+        try:
+            _, started, finished = await loop.run_in_executor(
+                self._executor, _render_image_variants, str(original), self.variants, self.quality
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._failed += 1
+            self._failed_digests.add(digest)
+            logging.exception('Failed to render variants for image %s', digest)
+        else:
+            self._completed += 1
+            self._run_times.append(finished - started)
+        finally:
+            self._pending.pop(digest, None)
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'workers': self.workers,
+            'variants': self.variants,
+            'pending': len(self._pending),
+            'completed': self._completed,
+            'failed': self._failed,
+            'render_time': PasswordHasher._summary(self._run_times),
+        }
+
+
+image_processor = ImageProcessor()
+
 # Helper functions
-def create_token(user_id: int, email: str) -> str:
+def create_token(user_id: int, email: str, is_admin: bool = False) -> str:
     payload = {
         'user_id': user_id,
         'email': email,
+        'role': 'admin' if is_admin else 'user',
         'exp': datetime.now(timezone.utc) + timedelta(days=30)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail='Token expired')
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail='Invalid token')
-
-def verify_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    payload = verify_token(credentials)
-    # Simple admin check - in production, add admin field to users table
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT email FROM users WHERE id = ?', (payload['user_id'],))
-        user = cursor.fetchone()
-        if user and user['email'] == 'admin@baajeelectronics.com':
+# Verified token cache
+# The same 30-day token is presented on every request, so a successfully
+# verified token's claims are remembered until its exp. Entries are keyed by
+# a digest of the token keyed with the secret: a token is only ever served
+# from the cache under the secret that verified it, and the raw token is
+# never kept in memory. Failures are not cached.
+class TokenCache:
+    def __init__(self, max_entries: int = TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4)
+    def _secret_key(secret: str) -> bytes:
+        return hashlib.sha256(secret.encode('utf-8')).digest()
+
+    def key(self, token: str, secret: str) -> bytes:
+        return hashlib.blake2b(token.encode('utf-8'), key=self._secret_key(secret), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
             return payload
+
+    def set(self, key: bytes, payload: dict):
+        expires_at = payload.get('exp')
+        # Only tokens that expire are cached; anything else is verified every time
+        if self.max_entries <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+            }
+
+token_cache = TokenCache()
+
+def decode_token(token: str) -> dict:
+    key = token_cache.key(token, JWT_SECRET)
+    payload = token_cache.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail='Token expired')
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail='Invalid token')
+        token_cache.set(key, payload)
+    # Handlers get their own copy so they can't alter the cached claims
+    return dict(payload)
+
+# Async so the (usually cached) check runs on the event loop instead of
+# costing every authenticated request a hop through the thread pool
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return decode_token(credentials.credentials)
+
+# Admin roster
+# Admin rights come from the token's role claim, so verify_admin never goes
+# to the database. A claim alone would keep a demoted admin in for the life
+# of the token, so it is also checked against the set of current admin ids,
+# which is reloaded every ADMIN_ROSTER_REFRESH seconds in the background, and
+# sooner when an admin token misses it: with several workers, an admin just
+# created or promoted by one of them is not yet in the others' rosters.
+class AdminRoster:
+    def __init__(self, interval: float = ADMIN_ROSTER_REFRESH):
+        self.interval = interval
+        self.ids = frozenset()
+        self._loaded_at = None
+        self._refresh_failures = 0
+        self._miss_reloads = 0
+        self._miss_lock = asyncio.Lock()
+        self._task = None
+
+    def load(self, conn):
+        self.ids = frozenset(row[0] for row in conn.execute('SELECT id FROM users WHERE is_admin = 1'))
+        self._loaded_at = time.monotonic()
+
+    async def refresh(self):
+        await db_read(self.load)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception:
+                # Keep the last known roster rather than locking every admin out
+                self._refresh_failures += 1
+                logging.exception('Failed to refresh the admin roster')
+
+    async def confirm(self, user_id) -> bool:
+        if user_id in self.ids:
+            return True
+        # Concurrent misses share one reload
+        async with self._miss_lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= ADMIN_ROSTER_MISS_INTERVAL:
+                self._miss_reloads += 1
+                try:
+                    await self.refresh()
+                except Exception:
+                    self._refresh_failures += 1
+                    logging.exception('Failed to refresh the admin roster')
+        return user_id in self.ids
+
+    def start(self):
+        with get_db() as conn:
+            self.load(conn)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'admins': len(self.ids),
+            'refresh_interval': self.interval,
+            'age': round(time.monotonic() - self._loaded_at, 3) if self._loaded_at is not None else None,
+            'refresh_failures': self._refresh_failures,
+            'miss_reloads': self._miss_reloads,
+        }
+
+admin_roster = AdminRoster()
+
+async def verify_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    payload = decode_token(credentials.credentials)
+    if payload.get('role') == 'admin' and await admin_roster.confirm(payload.get('user_id')):
+        return payload
     raise HTTPException(status_code=403, detail='Admin access required')
 
+# Catalog cache
+# Storefront reads (products, categories, banners, about) are cached as the
+# final JSON bytes, keyed by route and query params and tagged with the
+# tables they were read from. Each tag carries the table's catalog version;
+# when CatalogSync sees a newer one, entries with that tag are dropped, and a
+# read that raced with the change never stores its (stale) result. The TTL is
+# only a safety net.
+class ResponseCache:
+    def __init__(self, max_entries: int = CATALOG_CACHE_MAX_ENTRIES, ttl: float = CATALOG_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            value, tags, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def generation(self, tags) -> tuple:
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def set(self, key, value, tags, generation: tuple):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation != tuple(self._generations.get(tag, 0) for tag in tags):
+                return
+            self._entries[key] = (value, tuple(tags), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def sync(self, versions: dict):
+        with self._lock:
+            tags = {tag for tag, version in versions.items() if self._generations.get(tag, 0) != version}
+            if not tags:
+                return
+            self._generations.update(versions)
+            stale = [key for key, (_, entry_tags, _) in self._entries.items()
+                     if any(tag in entry_tags for tag in tags)]
+            for key in stale:
+                del self._entries[key]
+            self._invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+            }
+
+
+catalog_cache = ResponseCache()
+# The home page snapshot lives on its own so filter and search churn in
+# catalog_cache can never evict it
+storefront_cache = ResponseCache(max_entries=min(CATALOG_CACHE_MAX_ENTRIES, 1))
+
+# Catalog changes committed by any process show up in PRAGMA data_version
+# on a connection of our own; only then are the (few) version rows read.
+# Every cached read checks first, so no worker serves a body or ETag older
+# than the last commit. The PRAGMA only reads the WAL index (a few
+# microseconds), so it runs on the event loop; a change, or a check already
+# running on the read lane, sends the request to wait for one that started
+# after it arrived, shared by everyone else waiting. The
+# CATALOG_SYNC_INTERVAL poll only drops stale entries between requests.
+class CatalogSync:
+    def __init__(self, interval: float = CATALOG_SYNC_INTERVAL, caches=(catalog_cache, storefront_cache)):
+        self.interval = interval
+        self.caches = caches
+        self.versions = {}
+        self._conn = None
+        self._data_version = None
+        self._lock = threading.Lock()
+        self._task = None
+        self._running = None
+        self._pending = None
+        self._checks = 0
+        self._changes = 0
+        self._failures = 0
+
+    def check(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = db_pool._connect()
+            self._checks += 1
+            data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            versions = dict(self._conn.execute('SELECT tag, version FROM catalog_version').fetchall())
+            if versions != self.versions:
+                self._changes += 1
+                self.versions = versions
+                for cache in self.caches:
+                    cache.sync(versions)
+
+    async def refresh(self):
+        # On the read lane, but with its own connection rather than a pooled one
+        await asyncio.get_running_loop().run_in_executor(db_read_executor, self.check)
+
+    def unchanged(self) -> bool:
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._conn is None:
+                return False
+            self._checks += 1
+            return self._conn.execute('PRAGMA data_version').fetchone()[0] == self._data_version
+        finally:
+            self._lock.release()
+
+    async def ensure_current(self):
+        if self.unchanged():
+            return
+        # The running check may have read data_version before we arrived
+        if self._pending is None:
+            self._pending = asyncio.get_running_loop().create_task(self._checked(self._running))
+        await asyncio.shield(self._pending)
+
+    async def _checked(self, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+        self._running, self._pending = self._pending, None
+        try:
+            await self.refresh()
+        except Exception:
+            # Entries still expire by TTL while the database is unreachable
+            self._failures += 1
+            logging.exception('Failed to check catalog versions')
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.ensure_current()
+
+    def start(self):
+        self.check()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._running = self._pending = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        return {
+            'versions': self.versions,
+            'interval': self.interval,
+            'checks': self._checks,
+            'changes': self._changes,
+            'failures': self._failures,
+        }
+
+catalog_sync = CatalogSync()
+
+async def catalog_changed():
+    # Called by every admin route after it commits a catalog change, so this
+    # worker's caches drop what it made stale before the route returns
+    await catalog_sync.ensure_current()
+
+def json_bytes(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def model_json(adapter: TypeAdapter, data) -> bytes:
+    return adapter.dump_json(adapter.validate_python(data))
+
+# Row encoder for the large list responses. Rows go straight from sqlite3 to
+# JSON bytes without a per-row dict/model round trip: the JSON text column
+# (products.specs, orders.items) is spliced in verbatim instead of being
+# parsed and re-dumped, and the only conversion applied is the one
+# response_model would have done (SQLite 0/1 to bool). The routes keep their
+# response_model so the OpenAPI schema is unchanged.
+class RowEncoder:
+    def __init__(self, fields: List[str], raw_field: Optional[str] = None, coerce: Optional[dict] = None):
+        self.coerce = coerce or {}
+        if raw_field in fields:
+            split = fields.index(raw_field)
+            self.head, self.tail = fields[:split], fields[split + 1:]
+            self.raw_key = json.dumps(raw_field).encode('utf-8') + b':'
+            self.raw_field = raw_field
+        else:
+            self.head, self.tail = list(fields), []
+            self.raw_field = None
+
+    def _values(self, row, names) -> dict:
+        coerce = self.coerce
+        values = {name: row[name] for name in names}
+        for name, convert in coerce.items():
+            if values.get(name) is not None:
+                values[name] = convert(values[name])
+        return values
+
+    def encode(self, row) -> bytes:
+        out = json_bytes(self._values(row, self.head))
+        if self.raw_field is None:
+            return out
+        raw = row[self.raw_field]
+        out = out[:-1] + (b',' if self.head else b'') + self.raw_key + (raw.encode('utf-8') if raw else b'null')
+        if self.tail:
+            return out + b',' + json_bytes(self._values(row, self.tail))[1:]
+        return out + b'}'
+
+    def encode_list(self, rows) -> bytes:
+        return b'[' + b','.join(map(self.encode, rows)) + b']'
+
+# Response compression
+# Catalog responses are compressed once per encoding and kept next to the
+# plain body in the catalog cache. Everything else is compressed on the way
+# out by CompressionMiddleware; a response that already carries a
+# Content-Encoding (cached catalog bodies, precompressed frontend files) is
+# passed through untouched.
+def accepted_encodings(accept_encoding: Optional[str]) -> set:
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+class StreamCompressor:
+    # Compresses a streamed body chunk by chunk, flushing after each so the
+    # client still receives rows as they are produced
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes, last: bool) -> bytes:
+        if self.encoding == 'br':
+            out = self._compressor.process(chunk)
+            return out + (self._compressor.finish() if last else self._compressor.flush())
+        out = self._compressor.compress(chunk)
+        return out + self._compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+def compressible(content_type: Optional[str]) -> bool:
+    return (content_type or '').split(';', 1)[0].strip().lower() in COMPRESSIBLE_TYPES
+
+# Above this a body is compressed on a worker thread (zlib and brotli
+# release the GIL) instead of holding up the event loop
+COMPRESSION_THREAD_MIN = 256 * 1024
+
+class CachedBody:
+    # A cached catalog response plus its compressed forms, made on first use
+    __slots__ = ('body', 'headers', 'encoded')
+
+    def __init__(self, body: bytes, headers: dict):
+        self.body = body
+        self.headers = headers
+        self.encoded = {}
+
+    async def encode(self, encoding: Optional[str]) -> Optional[str]:
+        # Returns the encoding actually used; small bodies are left alone
+        if encoding is None or len(self.body) < COMPRESSION_MIN_SIZE:
+            return None
+        if encoding not in self.encoded:
+            if len(self.body) >= COMPRESSION_THREAD_MIN:
+                self.encoded[encoding] = await asyncio.to_thread(compress_body, self.body, encoding)
+            else:
+                self.encoded[encoding] = compress_body(self.body, encoding)
+        return encoding
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        request_headers = dict(scope['headers'])
+        encoding = negotiate_encoding(request_headers.get(b'accept-encoding', b'').decode('latin-1'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(raw=message['headers'])
+                if (message['status'] < 200 or message['status'] in (204, 304)
+                        or 'content-encoding' in headers or not compressible(headers.get('content-type'))):
+                    await send(message)
+                else:
+                    if 'accept-encoding' not in headers.get('vary', '').lower():
+                        headers.add_vary_header('Accept-Encoding')
+                    start = message
+                return
+
+            if start is None:
+                await send(message)
+                return
+            if message['type'] != 'http.response.body':
+                # e.g. pathsend: nothing to compress, send the file as is
+                await send(start)
+                start = None
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            headers = MutableHeaders(raw=start['headers'])
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    start = None
+                    return
+                compressor = StreamCompressor(encoding)
+                headers['Content-Encoding'] = encoding
+                if 'etag' in headers and not headers['etag'].startswith('W/'):
+                    headers['ETag'] = 'W/' + headers['etag']
+                if more_body:
+                    del headers['content-length']
+                    await send(start)
+                else:
+                    if len(body) >= COMPRESSION_THREAD_MIN:
+                        body = await asyncio.to_thread(compress_body, body, encoding)
+                    else:
+                        body = compress_body(body, encoding)
+                    headers['Content-Length'] = str(len(body))
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': body})
+                    start = None
+                    return
+            await send({
+                'type': 'http.response.body',
+                'body': compressor.compress(body, not more_body),
+                'more_body': more_body,
+            })
+            if not more_body:
+                start = None
+
+        await self.app(scope, receive, send_compressed)
+
+# Request metrics
+# The outermost layer, so the time covers compression and the whole of a
+# streamed body. Requests are labelled by route template (/api/products/{id})
+# rather than path, which keeps the number of series bounded.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_observed(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        metrics.inc('http_requests_in_flight')
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_observed)
+        finally:
+            metrics.inc('http_requests_in_flight', (), -1)
+            # Set on the scope by the router once a route has matched
+            route = scope.get('route')
+            path = route.path if route is not None else 'unmatched'
+            metrics.observe('http_request_duration_seconds', (scope['method'], path), time.perf_counter() - started)
+            metrics.inc('http_requests_total', (scope['method'], path, str(status_code)))
+
+# Query profile headers
+# Only installed with SQL_PROFILE on. The counts cover the statements run
+# before the response headers went out, which for a streamed response is the
+# work done before its first chunk.
+class QueryProfileMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile(f"{scope['method']} {scope['path']}")
+
+        async def send_profiled(message):
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(raw=message['headers'])
+                headers['X-Query-Count'] = str(len(profile.records))
+                headers.append('Server-Timing', f'db;dur={profile.duration * 1000:.2f};desc="{len(profile.records)} queries"')
+            await send(message)
+
+        token = query_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            query_profile.reset(token)
+            profile.report()
+
+# The ETag is derived from the version (invalidation generation) of every
+# table behind the response plus its cache key, so a revalidation can be
+# answered with 304 before the cache or the database is consulted.
+def catalog_etag(key: tuple, versions: tuple) -> str:
+    digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).hexdigest()
+    return f'"{BUILD_ID}-{".".join(map(str, versions))}-{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # If-None-Match uses the weak comparison function
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+async def cached_json(request: Request, key: tuple, tables: tuple, build, cache_control: str,
+                      cache: ResponseCache = catalog_cache) -> Response:
+    # `build(conn)` runs on a DB read thread and returns (body bytes, headers)
+    await catalog_sync.ensure_current()
+    if 'products' in tables and CATALOG_CACHE_TTL > 0:
+        # Stock changes don't bump the products version (orders would empty
+        # the caches), so responses showing it are rebuilt under a new key,
+        # and so a new ETag, every CATALOG_CACHE_TTL seconds
+        key += (int(time.time() // CATALOG_CACHE_TTL),)
+    generation = cache.generation(tables)
+    etag = catalog_etag(key, generation)
+    headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+    # Each encoding is its own representation with its own ETag, but any of
+    # them still matching means the client's copy is current
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+    encoded_etag = f'{etag[:-1]}-{encoding}"' if encoding else None
+    if_none_match = request.headers.get('if-none-match')
+    if etag_matches(if_none_match, etag) or (encoded_etag and etag_matches(if_none_match, encoded_etag)):
+        return Response(status_code=304, headers=headers)
+
+    entry = cache.get(key)
+    if entry is None:
+        entry = CachedBody(*await db_read(build))
+        cache.set(key, entry, tables, generation)
+    encoding = await entry.encode(encoding)
+    body = entry.body
+    if encoding:
+        body = entry.encoded[encoding]
+        headers.update({'ETag': encoded_etag, 'Content-Encoding': encoding})
+    return Response(content=body, media_type='application/json', headers={**entry.headers, **headers})
+
+# Pagination helpers
+# List endpoints page with an opaque keyset cursor (the sort value and id of
+# the last row served), so every page is an index range scan rather than an
+# OFFSET that re-reads everything before it. The body stays a plain list; the
+# next-page cursor and the optional total travel in response headers.
+PRODUCT_FIELDS = list(Product.model_fields)
+PRODUCT_SORTS = {'created_at': 'created_at', 'price': 'price', 'name': 'name'}
+
+def encode_cursor(sort: str, value, row_id: int) -> str:
+    raw = json.dumps([sort, value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+# Cursor values end up as bound parameters, so they must be something SQLite
+# can bind: bool is an int subclass but never a sort value, and ints are
+# 64-bit
+SQLITE_INT_RANGE = range(-2 ** 63, 2 ** 63)
+
+def bindable(value, types: tuple) -> bool:
+    if not isinstance(value, types) or isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return value in SQLITE_INT_RANGE
+    return not isinstance(value, float) or math.isfinite(value)
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    if not bindable(value, (str, int, float)) or not bindable(row_id, (int,)):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail='Cursor does not match the requested sort')
+    return value, row_id
+
+def parse_sort(sort: str, allowed: dict):
+    descending = sort.startswith('-')
+    key = sort[1:] if descending else sort
+    if key not in allowed:
+        raise HTTPException(status_code=400, detail=f"Invalid sort, expected one of: {', '.join(allowed)}")
+    return allowed[key], descending
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    selected = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in selected if f not in PRODUCT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if 'id' not in selected:
+        selected.insert(0, 'id')
+    return selected
+
+def page_limit(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    # No limit and no cursor keeps the original "return everything" behaviour
+    if limit is None and cursor:
+        return DEFAULT_PAGE_SIZE
+    return limit
+
+def page_query(sql: str, params: list, sort: str, sort_col: str, id_col: str,
+               descending: bool, limit: Optional[int], cursor: Optional[str]):
+    # `sql` is a SELECT ... WHERE ... that also selects the sort value and
+    # row id as _cursor_key / _cursor_id
+    params = list(params)
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort)
+        sql += f" AND ({sort_col}, {id_col}) {'<' if descending else '>'} (?, ?)"
+        params += [value, row_id]
+    direction = 'DESC' if descending else 'ASC'
+    sql += f' ORDER BY {sort_col} {direction}, {id_col} {direction}'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+    return sql, params
+
+def fetch_page(conn, sql: str, params: list, sort: str, sort_col: str, id_col: str,
+               descending: bool, limit: Optional[int], cursor: Optional[str]):
+    page_sql, page_params = page_query(sql, params, sort, sort_col, id_col, descending, limit, cursor)
+    rows = conn.execute(page_sql, page_params).fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, rows[-1]['_cursor_key'], rows[-1]['_cursor_id'])
+    return rows, next_cursor
+
+def count_rows(conn, sql: str, params: list) -> int:
+    return conn.execute(f'SELECT COUNT(*) FROM ({sql})', params).fetchone()[0]
+
+def page_headers(next_cursor: Optional[str], total: Optional[int]) -> dict:
+    headers = {}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    if total is not None:
+        headers['X-Total-Count'] = str(total)
+    return headers
+
+def product_columns(fields: Optional[List[str]], table: str = '') -> str:
+    prefix = f'{table}.' if table else ''
+    # specs is spliced into responses as-is, so only ever hand out valid JSON
+    return ', '.join(
+        f'CASE WHEN json_valid({prefix}specs) THEN {prefix}specs END AS specs' if f == 'specs' else prefix + f
+        for f in (fields or PRODUCT_FIELDS)
+    )
+
+# Product filters shared by the listing, facet counts and the plan audit.
+# Values of one spec key are ORed, different keys are ANDed.
+class ProductFilters:
+    def __init__(self, category_id: Optional[int] = None, featured: Optional[bool] = None,
+                 specs: Optional[dict] = None, min_price: Optional[float] = None,
+                 max_price: Optional[float] = None):
+        self.category_id = category_id
+        self.featured = featured
+        self.specs = specs or {}
+        self.min_price = min_price
+        self.max_price = max_price
+
+    def where(self):
+        sql = ''
+        params = []
+        if self.category_id:
+            sql += ' AND category_id = ?'
+            params.append(self.category_id)
+        if self.featured is not None:
+            sql += ' AND is_featured = ?'
+            params.append(1 if self.featured else 0)
+        if self.min_price is not None:
+            sql += ' AND price >= ?'
+            params.append(self.min_price)
+        if self.max_price is not None:
+            sql += ' AND price <= ?'
+            params.append(self.max_price)
+        for key, values in self.specs.items():
+            placeholders = ', '.join('?' * len(values))
+            sql += f' AND id IN (SELECT product_id FROM product_specs WHERE key = ? AND value IN ({placeholders}))'
+            params += [key, *values]
+        return sql, params
+
+    def cache_key(self) -> tuple:
+        return (self.category_id, self.featured, self.min_price, self.max_price, tuple(self.specs.items()))
+
+def product_filters(
+    category_id: Optional[int] = None,
+    featured: Optional[bool] = None,
+    spec: Optional[List[str]] = Query(None, description='Spec filter as Key:Value, repeatable'),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+) -> ProductFilters:
+    specs = {}
+    for item in spec or []:
+        key, sep, value = item.partition(':')
+        if not sep or not key.strip():
+            raise HTTPException(status_code=400, detail=f'Invalid spec filter {item!r}, expected Key:Value')
+        specs.setdefault(key.strip(), set()).add(value.strip())
+    specs = {key: tuple(sorted(values)) for key, values in sorted(specs.items())}
+    return ProductFilters(category_id, featured, specs, min_price, max_price)
+
+# Query builders shared by the list routes and the query plan audit
+def products_query(selected: Optional[List[str]], sort_col: str, filters: ProductFilters):
+    where, params = filters.where()
+    sql = f'SELECT {product_columns(selected)}, {sort_col} AS _cursor_key, id AS _cursor_id FROM products WHERE 1=1{where}'
+    return sql, params
+
+# One statement computes every facet: the filtered products are materialized
+# once, then grouped by spec key/value and by price bucket
+def facets_query(filters: ProductFilters):
+    where, params = filters.where()
+    bucket = 'CASE ' + ' '.join(f'WHEN price < {edge!r} THEN {i}' for i, edge in enumerate(PRICE_BUCKETS)) + f' ELSE {len(PRICE_BUCKETS)} END'
+    sql = f'''WITH matched AS MATERIALIZED (SELECT id, price FROM products WHERE 1=1{where})
+              SELECT 'spec' AS facet, s.key AS key, s.value AS value, COUNT(*) AS count
+              FROM matched JOIN product_specs s ON s.product_id = matched.id
+              GROUP BY s.key, s.value
+              UNION ALL
+              SELECT 'price', {bucket}, NULL, COUNT(*) FROM matched GROUP BY 2'''
+    return sql, params
+
+def facet_counts(rows) -> dict:
+    specs = {}
+    buckets = [0] * (len(PRICE_BUCKETS) + 1)
+    for row in rows:
+        if row['facet'] == 'spec':
+            specs.setdefault(row['key'], []).append({'value': row['value'], 'count': row['count']})
+        else:
+            buckets[row['key']] = row['count']
+    for values in specs.values():
+        values.sort(key=lambda v: (-v['count'], v['value']))
+    edges = [None, *PRICE_BUCKETS, None]
+    return {
+        'total': sum(buckets),
+        'specs': specs,
+        'price_buckets': [{'min': edges[i], 'max': edges[i + 1], 'count': count} for i, count in enumerate(buckets)],
+    }
+
+
+def favorites_query(selected: Optional[List[str]], user_id: int):
+    sql = f'''SELECT {product_columns(selected, 'p')}, f.created_at AS _cursor_key, f.id AS _cursor_id
+              FROM products p
+              JOIN favorites f ON p.id = f.product_id
+              WHERE f.user_id = ?'''
+    return sql, [user_id]
+
+def user_orders_query(user_id: int):
+    sql = '''SELECT *, created_at AS _cursor_key, id AS _cursor_id FROM orders
+             WHERE customer_email = (SELECT email FROM users WHERE id = ?)'''
+    return sql, [user_id]
+
+def orders_export_query(start: Optional[str], end: Optional[str], status: Optional[str]):
+    sql = 'SELECT *, created_at AS _cursor_key, id AS _cursor_id FROM orders WHERE 1 = 1'
+    params = []
+    if start:
+        sql += ' AND created_at >= ?'
+        params.append(start)
+    if end:
+        sql += ' AND created_at < ?'
+        params.append(end)
+    if status:
+        sql += ' AND status = ?'
+        params.append(status)
+    return sql, params
+
+# Every term is quoted (so user input can't inject FTS5 syntax) and
+# prefix-matched, implicitly ANDed together
+SEARCH_RANK = 'bm25(products_fts, 10.0, 2.0, 4.0, 1.0)'
+
+def search_match_expression(q: str) -> Optional[str]:
+    terms = re.findall(r'\w+', q)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def search_query(match: str, category_id: Optional[int] = None):
+    sql = f'''SELECT {product_columns(None, 'p')}, {SEARCH_RANK} AS score,
+                     highlight(products_fts, 0, '<mark>', '</mark>') AS highlighted_name,
+                     snippet(products_fts, -1, '<mark>', '</mark>', '…', 12) AS snippet,
+                     {SEARCH_RANK} AS _cursor_key, p.id AS _cursor_id
+              FROM products_fts
+              JOIN products p ON p.id = products_fts.rowid
+              WHERE products_fts MATCH ?'''
+    params = [match]
+    if category_id:
+        sql += ' AND p.category_id = ?'
+        params.append(category_id)
+    return sql, params
+
+def product_encoder(fields: Optional[List[str]] = None, extra: tuple = ()) -> RowEncoder:
+    return RowEncoder([*(fields or PRODUCT_FIELDS), *extra], 'specs', {'is_featured': bool})
+
+PRODUCT_ENCODER = product_encoder()
+SEARCH_RESULT_ENCODER = product_encoder(extra=('score', 'highlighted_name', 'snippet'))
+ORDER_ENCODER = RowEncoder(list(Order.model_fields), 'items')
+
+# Query plan audit
+# Runs EXPLAIN QUERY PLAN over the reads the API issues. List queries are
+# produced by the same builders the routes use, for every filter/sort/cursor
+# combination, so a new shape without a matching index is caught at boot.
+FULL_SCAN_PLAN = re.compile(r'^SCAN (?:TABLE )?(\S+)(?: AS \S+)?$')
+
+def audited_queries():
+    # (name, sql, params, status that is expected by design)
+    queries = []
+    for category_id, featured in [(None, None), (1, None), (None, True), (1, True)]:
+        for key, sort_col in PRODUCT_SORTS.items():
+            for descending in (True, False):
+                sort = ('-' if descending else '') + key
+                sql, params = products_query(None, sort_col, ProductFilters(category_id, featured))
+                name = f'products sort={sort} category_id={category_id} featured={featured}'
+                for cursor in (None, encode_cursor(sort, '', 0)):
+                    page_sql, page_params = page_query(sql, params, sort, sort_col, 'id', descending, DEFAULT_PAGE_SIZE, cursor)
+                    queries.append((name + (' +cursor' if cursor else ''), page_sql, page_params, None))
+                queries.append((name + ' count', f'SELECT COUNT(*) FROM ({sql})', params, None))
+
+    # The export walks the whole table in created_at order; a date range turns
+    # that into a range scan, status is checked row by row
+    for start in (None, '2025-01-01'):
+        for cursor in (None, encode_cursor('created_at', '', 0)):
+            sql, params = orders_export_query(start, None, 'pending')
+            page_sql, page_params = page_query(sql, params, 'created_at', 'created_at', 'id', False, EXPORT_CHUNK_SIZE, cursor)
+            name = 'orders export' + (' +start' if start else '') + (' +cursor' if cursor else '')
+            queries.append((name, page_sql, page_params, None))
+
+    # A spec filter narrows to the matching ids first, then sorts that set
+    spec_filters = ProductFilters(specs={'Warranty': ('1 year', '2 years')}, min_price=100.0, max_price=5000.0)
+    for key, sort_col in PRODUCT_SORTS.items():
+        sql, params = products_query(None, sort_col, spec_filters)
+        page_sql, page_params = page_query(sql, params, key, sort_col, 'id', False, DEFAULT_PAGE_SIZE, None)
+        queries.append((f'products sort={key} spec+price filters', page_sql, page_params, 'temp-sort'))
+
+    # Grouping by spec value/price bucket always needs a sort
+    for filters in (ProductFilters(), ProductFilters(category_id=1), spec_filters):
+        sql, params = facets_query(filters)
+        queries.append((f'facets {filters.cache_key()}', sql, params, 'temp-sort'))
+
+    for name, (sql, params) in [('favorites', favorites_query(None, 1)), ('user orders', user_orders_query(1))]:
+        for cursor in (None, encode_cursor('-created_at', '', 0)):
+            sort_col, id_col = ('f.created_at', 'f.id') if name == 'favorites' else ('created_at', 'id')
+            page_sql, page_params = page_query(sql, params, '-created_at', sort_col, id_col, True, DEFAULT_PAGE_SIZE, cursor)
+            queries.append((name + (' +cursor' if cursor else ''), page_sql, page_params, None))
+        queries.append((name + ' count', f'SELECT COUNT(*) FROM ({sql})', params, None))
+
+    # Relevance ordering can't come from an index, so search always sorts
+    for category_id in (None, 1):
+        sql, params = search_query('"led"*', category_id)
+        for cursor in (None, encode_cursor('relevance', 0.0, 0)):
+            page_sql, page_params = page_query(sql, params, 'relevance', SEARCH_RANK, 'p.id', False, DEFAULT_PAGE_SIZE, cursor)
+            name = f'search category_id={category_id}' + (' +cursor' if cursor else '')
+            queries.append((name, page_sql, page_params, 'temp-sort'))
+
+    queries += [
+        ('product by id', 'SELECT * FROM products WHERE id = ?', [1], None),
+        ('products by sku', 'SELECT COUNT(*) FROM products WHERE sku IN (?, ?)', ['a', 'b'], None),
+        ('user by id', 'SELECT email FROM users WHERE id = ?', [1], None),
+        ('admin roster', 'SELECT id FROM users WHERE is_admin = 1', [], None),
+        ('user by email', 'SELECT * FROM users WHERE email = ?', [''], None),
+        ('categories', 'SELECT * FROM categories ORDER BY name', [], None),
+        ('banners', 'SELECT * FROM banners ORDER BY order_index', [], None),
+        ('active banners', 'SELECT * FROM banners WHERE is_active = 1 ORDER BY order_index', [], None),
+        ('orders', 'SELECT * FROM orders ORDER BY created_at DESC', [], None),
+        ('order pricing', 'SELECT id, name, price, stock FROM products WHERE id IN (?, ?)', [1, 2], None),
+        ('order stock decrement', 'UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?', [1, 1, 1], None),
+        ('order items', 'SELECT * FROM order_items WHERE order_id = ?', [1], None),
+        ('units sold', 'SELECT SUM(quantity) FROM order_items WHERE product_id = ?', [1], None),
+        ('remove favorite', 'DELETE FROM favorites WHERE user_id = ? AND product_id = ?', [1, 1], None),
+        # Walks the rowid backwards and stops after one row
+        ('about', 'SELECT * FROM about_us ORDER BY id DESC LIMIT 1', [], 'full-scan'),
+    ]
+    return queries
+
+def audit_query_plans(conn):
+    report = []
+    for name, sql, params, expected in audited_queries():
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        # Scanning a materialized CTE or subquery result is not a table scan
+        derived = {d.split()[1] for d in plan if d.startswith(('MATERIALIZE ', 'CO-ROUTINE '))}
+        scans = [m.group(1) for m in map(FULL_SCAN_PLAN.match, plan) if m]
+        status = 'ok'
+        if any(table not in derived for table in scans):
+            status = 'full-scan'
+        elif any(d.startswith('USE TEMP B-TREE') for d in plan):
+            status = 'temp-sort'
+        if status == expected:
+            status = 'ok'
+        report.append({'name': name, 'status': status, 'plan': plan})
+    return report
+
+def run_query_plan_audit(mode: str = QUERY_PLAN_AUDIT):
+    if mode == 'off':
+        return []
+    with get_db() as conn:
+        report = audit_query_plans(conn)
+
+    for entry in report:
+        if entry['status'] == 'temp-sort':
+            logging.warning('Query plan for %s sorts in a temp b-tree: %s', entry['name'], ' | '.join(entry['plan']))
+    failures = [e for e in report if e['status'] == 'full-scan']
+    if failures:
+        details = '; '.join(f"{e['name']}: {' | '.join(e['plan'])}" for e in failures)
+        if mode == 'strict':
+            raise RuntimeError(f'Query plan audit found full table scans: {details}')
+        logging.warning('Query plan audit found full table scans: %s', details)
+    return report
+
 # Auth Routes
 @api_router.post('/auth/signup')
 async def signup(user: UserSignup):
-    with get_db() as conn:
+    def query(conn):
         cursor = conn.cursor()
         cursor.execute('SELECT id FROM users WHERE email = ?', (user.email,))
-        if cursor.fetchone():
+        return cursor.fetchone()
+
+    if await db_read(query):
+        raise HTTPException(status_code=400, detail='Email already registered')
+    
+    password_hash = await password_hasher.hash(user.password)
+    now = datetime.now(timezone.utc).isoformat()
+
+    def mutate(conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                'INSERT INTO users (email, password_hash, name, created_at) VALUES (?, ?, ?, ?)',
+                (user.email, password_hash, user.name, now)
+            )
+        except sqlite3.IntegrityError:
             raise HTTPException(status_code=400, detail='Email already registered')
-        
-        password_hash = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        now = datetime.now(timezone.utc).isoformat()
-        
-        cursor.execute(
-            'INSERT INTO users (email, password_hash, name, created_at) VALUES (?, ?, ?, ?)',
-            (user.email, password_hash, user.name, now)
-        )
         conn.commit()
-        user_id = cursor.lastrowid
-        
-        token = create_token(user_id, user.email)
-        return {'token': token, 'user': {'id': user_id, 'email': user.email, 'name': user.name}}
+        return cursor.lastrowid
+
+    user_id = await db_write(mutate)
+    token = create_token(user_id, user.email)
+    return {'token': token, 'user': {'id': user_id, 'email': user.email, 'name': user.name}}
 
 @api_router.post('/auth/login')
 async def login(user: UserLogin):
-    with get_db() as conn:
+    def query(conn):
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM users WHERE email = ?', (user.email,))
-        db_user = cursor.fetchone()
-        
-        if not db_user:
-            raise HTTPException(status_code=401, detail='Invalid credentials')
-        
-        if not bcrypt.checkpw(user.password.encode('utf-8'), db_user['password_hash'].encode('utf-8')):
-            raise HTTPException(status_code=401, detail='Invalid credentials')
-        
-        token = create_token(db_user['id'], db_user['email'])
-        return {
-            'token': token,
-            'user': {
-                'id': db_user['id'],
-                'email': db_user['email'],
-                'name': db_user['name'],
-                'profile_picture': db_user['profile_picture'],
-                'auth_provider': db_user['auth_provider']
-            }
+        return cursor.fetchone()
+
+    db_user = await db_read(query)
+    
+    if not db_user:
+        raise HTTPException(status_code=401, detail='Invalid credentials')
+    
+    if not await password_hasher.check(user.password, db_user['password_hash']):
+        raise HTTPException(status_code=401, detail='Invalid credentials')
+    
+    token = create_token(db_user['id'], db_user['email'], bool(db_user['is_admin']))
+    return {
+        'token': token,
+        'user': {
+            'id': db_user['id'],
+            'email': db_user['email'],
+            'name': db_user['name'],
+            'profile_picture': db_user['profile_picture'],
+            'auth_provider': db_user['auth_provider']
         }
+    }
 
 @api_router.get('/auth/me')
 async def get_current_user(payload = Depends(verify_token)):
-    with get_db() as conn:
+    def query(conn):
         cursor = conn.cursor()
         cursor.execute('SELECT id, email, name, profile_picture, auth_provider FROM users WHERE id = ?',
                       (payload['user_id'],))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail='User not found')
-        return dict(user)
+        return cursor.fetchone()
+
+    user = await db_read(query)
+    if not user:
+        raise HTTPException(status_code=404, detail='User not found')
+    return dict(user)
 
 # Admin login
 @api_router.post('/admin/login')
@@ -389,316 +2671,739 @@ async def admin_login(credentials: dict):
     
     if username == 'admin' and password == 'admin123':
         # Create or get admin user
-        with get_db() as conn:
+        def query(conn):
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE email = ?', ('admin@baajeelectronics.com',))
-            admin_user = cursor.fetchone()
-            
-            if not admin_user:
-                password_hash = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                now = datetime.now(timezone.utc).isoformat()
+            cursor.execute('SELECT * FROM users WHERE email = ?', (ADMIN_EMAIL,))
+            return cursor.fetchone()
+
+        admin_user = await db_read(query)
+        
+        if not admin_user:
+            password_hash = await password_hasher.hash('admin123')
+            now = datetime.now(timezone.utc).isoformat()
+
+            def mutate(conn):
+                cursor = conn.cursor()
                 cursor.execute(
-                    'INSERT INTO users (email, password_hash, name, created_at) VALUES (?, ?, ?, ?)',
-                    ('admin@baajeelectronics.com', password_hash, 'Admin', now)
+                    'INSERT OR IGNORE INTO users (email, password_hash, name, created_at, is_admin) VALUES (?, ?, ?, ?, 1)',
+                    (ADMIN_EMAIL, password_hash, 'Admin', now)
                 )
                 conn.commit()
-                user_id = cursor.lastrowid
-            else:
-                user_id = admin_user['id']
-            
-            token = create_token(user_id, 'admin@baajeelectronics.com')
-            return {'token': token, 'user': {'id': user_id, 'email': 'admin@baajeelectronics.com', 'name': 'Admin'}}
+                cursor.execute('SELECT id FROM users WHERE email = ?', (ADMIN_EMAIL,))
+                return cursor.fetchone()['id']
+
+            user_id = await db_write(mutate)
+            await admin_roster.refresh()
+        elif not admin_user['is_admin']:
+            raise HTTPException(status_code=403, detail='Admin access required')
+        else:
+            user_id = admin_user['id']
+        
+        token = create_token(user_id, ADMIN_EMAIL, True)
+        return {'token': token, 'user': {'id': user_id, 'email': ADMIN_EMAIL, 'name': 'Admin'}}
     
     raise HTTPException(status_code=401, detail='Invalid admin credentials')
 
 # Product Routes
 @api_router.get('/products', response_model=List[Product])
-async def get_products(category_id: Optional[int] = None, featured: Optional[bool] = None):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        query = 'SELECT * FROM products WHERE 1=1'
-        params = []
-        
-        if category_id:
-            query += ' AND category_id = ?'
-            params.append(category_id)
-        if featured is not None:
-            query += ' AND is_featured = ?'
-            params.append(1 if featured else 0)
-        
-        query += ' ORDER BY created_at DESC'
-        cursor.execute(query, params)
-        products = [dict(row) for row in cursor.fetchall()]
-        
-        # Parse specs JSON
-        for p in products:
-            if p['specs']:
-                p['specs'] = json.loads(p['specs'])
-        
-        return products
+async def get_products(
+    request: Request,
+    filters: ProductFilters = Depends(product_filters),
+    sort: str = '-created_at',
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
+):
+    sort_col, descending = parse_sort(sort, PRODUCT_SORTS)
+    selected = parse_fields(fields)
+    limit = page_limit(limit, cursor)
+
+    def build(conn):
+        sql, params = products_query(selected, sort_col, filters)
+        rows, next_cursor = fetch_page(conn, sql, params, sort, sort_col, 'id', descending, limit, cursor)
+        total = count_rows(conn, sql, params) if include_total else None
+        encoder = product_encoder(selected) if selected else PRODUCT_ENCODER
+        return encoder.encode_list(rows), page_headers(next_cursor, total)
+
+    key = ('products', filters.cache_key(), sort, limit, cursor, tuple(selected or ()), include_total)
+    return await cached_json(request, key, ('products',), build, CACHE_CONTROL['products'])
+
+@api_router.get('/products/facets', response_model=ProductFacets)
+async def get_product_facets(request: Request, filters: ProductFilters = Depends(product_filters)):
+    def build(conn):
+        sql, params = facets_query(filters)
+        return model_json(FACETS, facet_counts(conn.execute(sql, params).fetchall())), {}
+
+    key = ('facets', filters.cache_key())
+    return await cached_json(request, key, ('products',), build, CACHE_CONTROL['products'])
+
+@api_router.get('/products/search', response_model=List[ProductSearchResult])
+async def search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    category_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+):
+    match = search_match_expression(q)
+
+    def build(conn):
+        if match is None:
+            return b'[]', page_headers(None, 0 if include_total else None)
+        sql, params = search_query(match, category_id)
+        rows, next_cursor = fetch_page(conn, sql, params, 'relevance', SEARCH_RANK, 'p.id', False, limit, cursor)
+        total = count_rows(conn, sql, params) if include_total else None
+        return SEARCH_RESULT_ENCODER.encode_list(rows), page_headers(next_cursor, total)
+
+    key = ('search', match, category_id, limit, cursor, include_total)
+    return await cached_json(request, key, ('products', 'categories'), build, CACHE_CONTROL['products'])
 
 @api_router.get('/products/{product_id}', response_model=Product)
-async def get_product(product_id: int):
-    with get_db() as conn:
+async def get_product(request: Request, product_id: int):
+    def build(conn):
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
+        cursor.execute(f'SELECT {product_columns(None)} FROM products WHERE id = ?', (product_id,))
         product = cursor.fetchone()
         
         if not product:
             raise HTTPException(status_code=404, detail='Product not found')
         
-        product_dict = dict(product)
-        if product_dict['specs']:
-            product_dict['specs'] = json.loads(product_dict['specs'])
-        
-        return product_dict
+        return PRODUCT_ENCODER.encode(product), {}
+
+    return await cached_json(request, ('product', product_id), ('products',), build, CACHE_CONTROL['product'])
 
 @api_router.post('/products')
 async def create_product(product: ProductCreate, payload = Depends(verify_admin)):
-    with get_db() as conn:
+    now = datetime.now(timezone.utc).isoformat()
+    specs_json = json.dumps(product.specs) if product.specs else None
+
+    def mutate(conn):
         cursor = conn.cursor()
-        now = datetime.now(timezone.utc).isoformat()
-        specs_json = json.dumps(product.specs) if product.specs else None
-        
-        cursor.execute(
-            '''INSERT INTO products (name, description, price, category_id, image_url, specs, stock, is_featured, created_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-            (product.name, product.description, product.price, product.category_id,
-             product.image_url, specs_json, product.stock, product.is_featured, now)
-        )
+        try:
+            cursor.execute(
+                '''INSERT INTO products (name, description, price, category_id, image_url, specs, stock, is_featured, created_at, sku)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (product.name, product.description, product.price, product.category_id,
+                 product.image_url, specs_json, product.stock, product.is_featured, now, product.sku)
+            )
+        except sqlite3.IntegrityError:
+            raise HTTPException(status_code=400, detail='SKU already in use')
         conn.commit()
-        return {'id': cursor.lastrowid, 'message': 'Product created'}
+        return cursor.lastrowid
+
+    product_id = await db_write(mutate)
+    await catalog_changed()
+    return {'id': product_id, 'message': 'Product created'}
+
+# Bulk import
+# The upload is parsed a line at a time off the spooled file on a worker
+# thread, validated row by row and upserted on sku in IMPORT_BATCH_SIZE
+# transactions, so memory stays flat and other writes get the writer lane
+# between batches. Bad rows are skipped and reported, good ones still land.
+PRODUCT_IMPORT_ROW = TypeAdapter(ProductImportRow)
+
+PRODUCT_UPSERT = '''
+    INSERT INTO products (sku, name, description, price, category_id, image_url, specs, stock, is_featured, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (sku) WHERE sku IS NOT NULL DO UPDATE SET
+        name = excluded.name, description = excluded.description, price = excluded.price,
+        category_id = excluded.category_id, image_url = excluded.image_url, specs = excluded.specs,
+        stock = excluded.stock, is_featured = excluded.is_featured
+    -- Re-importing an unchanged row is a no-op, so it doesn't churn the search index
+    WHERE (name, description, price, category_id, image_url, specs, stock, is_featured)
+          IS NOT (excluded.name, excluded.description, excluded.price, excluded.category_id,
+                  excluded.image_url, excluded.specs, excluded.stock, excluded.is_featured)
+'''
+
+def import_format(fmt: Optional[str], filename: Optional[str]) -> str:
+    if not fmt and filename:
+        fmt = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}.get(Path(filename).suffix.lower())
+    if fmt not in ('csv', 'ndjson'):
+        raise HTTPException(status_code=400, detail='Invalid format, expected csv or ndjson')
+    return fmt
+
+def iter_import_records(file, fmt: str):
+    # Yields (line number, record dict or error message)
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            # Empty cells mean "not given" so field defaults apply
+            values = {key.strip(): value.strip() for key, value in record.items()
+                      if key and isinstance(value, str) and value.strip()}
+            if 'specs' in values:
+                try:
+                    values['specs'] = json.loads(values['specs'])
+                except ValueError:
+                    yield reader.line_num, 'specs: not valid JSON'
+                    continue
+            yield reader.line_num, values
+        return
+
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, 'not valid JSON'
+            continue
+        yield line_number, record if isinstance(record, dict) else 'expected a JSON object'
+
+def read_import_batch(records, categories: dict, now: str):
+    # Pulls up to IMPORT_BATCH_SIZE valid rows; returns (rows, errors, done)
+    rows, errors = [], []
+    for line_number, record in records:
+        if isinstance(record, str):
+            errors.append({'line': line_number, 'sku': None, 'errors': [record]})
+            continue
+        try:
+            product = PRODUCT_IMPORT_ROW.validate_python(record)
+        except ValidationError as e:
+            messages = [f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()]
+            errors.append({'line': line_number, 'sku': record.get('sku'), 'errors': messages})
+            continue
+
+        category_id = product.category_id
+        if product.category is not None:
+            category_id = categories.get(product.category.strip().lower())
+            if category_id is None:
+                errors.append({'line': line_number, 'sku': product.sku, 'errors': [f'category: unknown category {product.category!r}']})
+                continue
+        elif category_id is not None and category_id not in categories.values():
+            errors.append({'line': line_number, 'sku': product.sku, 'errors': [f'category_id: unknown category {category_id}']})
+            continue
+
+        rows.append((product.sku, product.name, product.description, product.price, category_id, product.image_url,
+                     json.dumps(product.specs) if product.specs else None, product.stock, product.is_featured, now))
+        if len(rows) >= IMPORT_BATCH_SIZE:
+            return rows, errors, False
+    return rows, errors, True
+
+def upsert_import_batch(conn, rows: list):
+    # A SKU repeated within the batch is applied once, from its last row
+    rows = list({row[0]: row for row in rows}.values())
+    skus = [row[0] for row in rows]
+    # Counted in the same transaction as the upsert, so another process
+    # can't add one of these SKUs in between
+    conn.execute('BEGIN IMMEDIATE')
+    existing = 0
+    # Stay under SQLite's bound parameter limit
+    for start in range(0, len(skus), 500):
+        chunk = skus[start:start + 500]
+        existing += conn.execute(
+            f"SELECT COUNT(*) FROM products WHERE sku IN ({', '.join('?' * len(chunk))})", chunk
+        ).fetchone()[0]
+    changed = conn.executemany(PRODUCT_UPSERT, rows).rowcount
+    conn.commit()
+    created = len(skus) - existing
+    updated = min(max(changed - created, 0), existing)
+    return created, updated, existing - updated
+
+@api_router.post('/products/import')
+async def import_products(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None),
+    payload = Depends(verify_admin),
+):
+    fmt = import_format(format, file.filename)
+    now = datetime.now(timezone.utc).isoformat()
+
+    def query(conn):
+        return {row['name'].strip().lower(): row['id'] for row in conn.execute('SELECT id, name FROM categories')}
+
+    categories = await db_read(query)
+    records = iter_import_records(file.file, fmt)
+    loop = asyncio.get_running_loop()
+    report = {'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0, 'errors': []}
+    try:
+        done = False
+        while not done:
+            rows, errors, done = await loop.run_in_executor(None, read_import_batch, records, categories, now)
+            report['failed'] += len(errors)
+            report['errors'].extend(errors[:IMPORT_MAX_ERRORS - len(report['errors'])])
+            if rows:
+                created, updated, unchanged = await db_write(upsert_import_batch, rows)
+                report['created'] += created
+                report['updated'] += updated
+                report['unchanged'] += unchanged
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail='File must be UTF-8 encoded')
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f'Malformed CSV: {e}')
+    finally:
+        if report['created'] or report['updated']:
+            await catalog_changed()
+
+    return report
 
 @api_router.put('/products/{product_id}')
 async def update_product(product_id: int, product: ProductCreate, payload = Depends(verify_admin)):
-    with get_db() as conn:
+    specs_json = json.dumps(product.specs) if product.specs else None
+
+    def mutate(conn):
         cursor = conn.cursor()
-        specs_json = json.dumps(product.specs) if product.specs else None
-        
+        # The admin form doesn't send sku, so a missing one leaves it as is
+        try:
+            cursor.execute(
+                '''UPDATE products SET name=?, description=?, price=?, category_id=?, image_url=?, specs=?, stock=?, is_featured=?,
+                   sku=COALESCE(?, sku) WHERE id=?''',
+                (product.name, product.description, product.price, product.category_id,
+                 product.image_url, specs_json, product.stock, product.is_featured, product.sku, product_id)
+            )
+        except sqlite3.IntegrityError:
+            raise HTTPException(status_code=400, detail='SKU already in use')
+        conn.commit()
+        return cursor.rowcount
+
+    if await db_write(mutate) == 0:
+        raise HTTPException(status_code=404, detail='Product not found')
+    
+    await catalog_changed()
+    return {'message': 'Product updated'}
+
+# Partial bulk update for the POS price/stock sync: every patch goes through
+# one prepared statement in a single transaction, fields left out keep their
+# current value.
+PRODUCT_PATCH = '''
+    UPDATE products SET price = COALESCE(?, price), stock = COALESCE(?, stock), is_featured = COALESCE(?, is_featured)
+    WHERE id = ?
+'''
+
+@api_router.patch('/products')
+async def patch_products(patches: List[ProductPatch], payload = Depends(verify_admin)):
+    ids = json.dumps([patch.id for patch in patches])
+
+    def mutate(conn):
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
         cursor.execute(
-            '''UPDATE products SET name=?, description=?, price=?, category_id=?, image_url=?, specs=?, stock=?, is_featured=?
-               WHERE id=?''',
-            (product.name, product.description, product.price, product.category_id,
-             product.image_url, specs_json, product.stock, product.is_featured, product_id)
+            'SELECT DISTINCT j.value FROM json_each(?) j LEFT JOIN products p ON p.id = j.value WHERE p.id IS NULL',
+            (ids,)
+        )
+        missing = [row[0] for row in cursor.fetchall()]
+        cursor.executemany(
+            PRODUCT_PATCH,
+            [(patch.price, patch.stock, patch.is_featured, patch.id) for patch in patches]
         )
         conn.commit()
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail='Product not found')
-        
-        return {'message': 'Product updated'}
+        return cursor.rowcount, missing
+
+    updated, missing = await db_write(mutate) if patches else (0, [])
+    if updated:
+        await catalog_changed()
+    return {'updated': updated, 'missing': missing}
 
 @api_router.delete('/products/{product_id}')
 async def delete_product(product_id: int, payload = Depends(verify_admin)):
-    with get_db() as conn:
+    def mutate(conn):
         cursor = conn.cursor()
         cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
         conn.commit()
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail='Product not found')
-        
-        return {'message': 'Product deleted'}
+        return cursor.rowcount
+
+    if await db_write(mutate) == 0:
+        raise HTTPException(status_code=404, detail='Product not found')
+    
+    await catalog_changed()
+    return {'message': 'Product deleted'}
 
 # Category Routes
 @api_router.get('/categories', response_model=List[Category])
-async def get_categories():
-    with get_db() as conn:
+async def get_categories(request: Request):
+    def build(conn):
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM categories ORDER BY name')
-        return [dict(row) for row in cursor.fetchall()]
+        return model_json(CATEGORY_LIST, [dict(row) for row in cursor.fetchall()]), {}
+
+    return await cached_json(request, ('categories',), ('categories',), build, CACHE_CONTROL['categories'])
 
 @api_router.post('/categories')
 async def create_category(category: CategoryCreate, payload = Depends(verify_admin)):
-    with get_db() as conn:
+    now = datetime.now(timezone.utc).isoformat()
+
+    def mutate(conn):
         cursor = conn.cursor()
-        now = datetime.now(timezone.utc).isoformat()
         cursor.execute(
             'INSERT INTO categories (name, image_url, created_at) VALUES (?, ?, ?)',
             (category.name, category.image_url, now)
         )
         conn.commit()
-        return {'id': cursor.lastrowid, 'message': 'Category created'}
+        return cursor.lastrowid
+
+    category_id = await db_write(mutate)
+    await catalog_changed()
+    return {'id': category_id, 'message': 'Category created'}
 
 @api_router.put('/categories/{category_id}')
 async def update_category(category_id: int, category: CategoryCreate, payload = Depends(verify_admin)):
-    with get_db() as conn:
+    def mutate(conn):
         cursor = conn.cursor()
         cursor.execute(
             'UPDATE categories SET name=?, image_url=? WHERE id=?',
             (category.name, category.image_url, category_id)
         )
         conn.commit()
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail='Category not found')
-        
-        return {'message': 'Category updated'}
+        return cursor.rowcount
+
+    if await db_write(mutate) == 0:
+        raise HTTPException(status_code=404, detail='Category not found')
+    
+    await catalog_changed()
+    return {'message': 'Category updated'}
 
 @api_router.delete('/categories/{category_id}')
 async def delete_category(category_id: int, payload = Depends(verify_admin)):
-    with get_db() as conn:
+    def mutate(conn):
         cursor = conn.cursor()
         cursor.execute('DELETE FROM categories WHERE id = ?', (category_id,))
         conn.commit()
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail='Category not found')
-        
-        return {'message': 'Category deleted'}
+        return cursor.rowcount
+
+    if await db_write(mutate) == 0:
+        raise HTTPException(status_code=404, detail='Category not found')
+    
+    await catalog_changed()
+    return {'message': 'Category deleted'}
 
 # Banner Routes
 @api_router.get('/banners', response_model=List[Banner])
-async def get_banners(active_only: bool = False):
-    with get_db() as conn:
+async def get_banners(request: Request, active_only: bool = False):
+    def build(conn):
         cursor = conn.cursor()
-        query = 'SELECT * FROM banners'
+        sql = 'SELECT * FROM banners'
         if active_only:
-            query += ' WHERE is_active = 1'
-        query += ' ORDER BY order_index'
-        cursor.execute(query)
-        return [dict(row) for row in cursor.fetchall()]
+            sql += ' WHERE is_active = 1'
+        sql += ' ORDER BY order_index'
+        cursor.execute(sql)
+        return model_json(BANNER_LIST, [dict(row) for row in cursor.fetchall()]), {}
+
+    return await cached_json(request, ('banners', active_only), ('banners',), build, CACHE_CONTROL['banners'])
 
 @api_router.post('/banners')
 async def create_banner(banner: BannerCreate, payload = Depends(verify_admin)):
-    with get_db() as conn:
+    now = datetime.now(timezone.utc).isoformat()
+
+    def mutate(conn):
         cursor = conn.cursor()
-        now = datetime.now(timezone.utc).isoformat()
         cursor.execute(
             'INSERT INTO banners (title, image_url, link, is_active, order_index, created_at) VALUES (?, ?, ?, ?, ?, ?)',
             (banner.title, banner.image_url, banner.link, banner.is_active, banner.order_index, now)
         )
         conn.commit()
-        return {'id': cursor.lastrowid, 'message': 'Banner created'}
+        return cursor.lastrowid
+
+    banner_id = await db_write(mutate)
+    await catalog_changed()
+    return {'id': banner_id, 'message': 'Banner created'}
 
 @api_router.put('/banners/{banner_id}')
 async def update_banner(banner_id: int, banner: BannerCreate, payload = Depends(verify_admin)):
-    with get_db() as conn:
+    def mutate(conn):
         cursor = conn.cursor()
         cursor.execute(
             'UPDATE banners SET title=?, image_url=?, link=?, is_active=?, order_index=? WHERE id=?',
             (banner.title, banner.image_url, banner.link, banner.is_active, banner.order_index, banner_id)
         )
         conn.commit()
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail='Banner not found')
-        
-        return {'message': 'Banner updated'}
+        return cursor.rowcount
+
+    if await db_write(mutate) == 0:
+        raise HTTPException(status_code=404, detail='Banner not found')
+    
+    await catalog_changed()
+    return {'message': 'Banner updated'}
 
 @api_router.delete('/banners/{banner_id}')
 async def delete_banner(banner_id: int, payload = Depends(verify_admin)):
-    with get_db() as conn:
+    def mutate(conn):
         cursor = conn.cursor()
         cursor.execute('DELETE FROM banners WHERE id = ?', (banner_id,))
         conn.commit()
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail='Banner not found')
-        
-        return {'message': 'Banner deleted'}
+        return cursor.rowcount
+
+    if await db_write(mutate) == 0:
+        raise HTTPException(status_code=404, detail='Banner not found')
+    
+    await catalog_changed()
+    return {'message': 'Banner deleted'}
 
 # Order Routes
 @api_router.post('/orders')
 async def create_order(order: OrderCreate):
-    with get_db() as conn:
+    now = datetime.now(timezone.utc).isoformat()
+    quantities = {}
+    for item in order.items:
+        quantities[item.id] = quantities.get(item.id, 0) + item.quantity
+    product_ids = list(quantities)
+    placeholders = ', '.join('?' * len(product_ids))
+
+    def mutate(conn):
         cursor = conn.cursor()
-        now = datetime.now(timezone.utc).isoformat()
-        items_json = json.dumps(order.items)
-        
+        # Take the write lock up front so prices and stock can't change between
+        # reading them here and the decrement below
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(f'SELECT id, name, price, stock FROM products WHERE id IN ({placeholders})', product_ids)
+        products = {row['id']: row for row in cursor.fetchall()}
+
+        missing = [product_id for product_id in product_ids if product_id not in products]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Unknown products: {', '.join(map(str, missing))}")
+        short = [products[product_id]['name'] for product_id, quantity in quantities.items()
+                 if (products[product_id]['stock'] or 0) < quantity]
+        if short:
+            raise HTTPException(status_code=409, detail=f"Insufficient stock for: {', '.join(short)}")
+
+        cursor.executemany(
+            'UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?',
+            [(quantity, product_id, quantity) for product_id, quantity in quantities.items()]
+        )
+        if cursor.rowcount != len(quantities):
+            raise HTTPException(status_code=409, detail='Insufficient stock')
+
+        lines = [(product_id, products[product_id]['name'], products[product_id]['price'], quantity)
+                 for product_id, quantity in quantities.items()]
+        total = round(sum(price * quantity for _, _, price, quantity in lines), 2)
+        items_json = json.dumps([{'id': product_id, 'name': name, 'price': price, 'quantity': quantity}
+                                 for product_id, name, price, quantity in lines])
         cursor.execute(
             '''INSERT INTO orders (customer_name, customer_email, customer_phone, customer_location, items, total_amount, created_at)
                VALUES (?, ?, ?, ?, ?, ?, ?)''',
             (order.customer_name, order.customer_email, order.customer_phone,
-             order.customer_location, items_json, order.total_amount, now)
+             order.customer_location, items_json, total, now)
         )
-        conn.commit()
         order_id = cursor.lastrowid
-        
-        return {'id': order_id, 'message': 'Order created successfully'}
+        cursor.executemany(
+            'INSERT INTO order_items (order_id, product_id, name, unit_price, quantity) VALUES (?, ?, ?, ?, ?)',
+            [(order_id, *line) for line in lines]
+        )
+        conn.commit()
+        return order_id, total
+
+    order_id, total = await db_write(mutate)
+    return {'id': order_id, 'total_amount': total, 'message': 'Order created successfully'}
 
 @api_router.get('/orders', response_model=List[Order])
 async def get_orders(payload = Depends(verify_admin)):
-    with get_db() as conn:
+    def query(conn):
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM orders ORDER BY created_at DESC')
-        orders = [dict(row) for row in cursor.fetchall()]
-        
-        for order in orders:
-            order['items'] = json.loads(order['items'])
-        
-        return orders
+        return ORDER_ENCODER.encode_list(cursor.fetchall())
+
+    return Response(content=await db_read(query), media_type='application/json')
+
+EXPORT_CSV_COLUMNS = ['id', 'user_id', 'customer_name', 'customer_email', 'customer_phone',
+                      'customer_location', 'status', 'total_amount', 'created_at', 'items']
+
+def parse_export_bound(value: Optional[str], name: str, end: bool = False) -> Optional[str]:
+    # Accepts a date or an ISO datetime (naive means UTC) and returns it in the
+    # same form orders.created_at is stored in. A bare end date includes that day.
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f'Invalid {name}, expected an ISO date or datetime')
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+# Orders are read in keyset chunks, each on its own short read, and written
+# out as they arrive: memory stays flat however many orders there are and no
+# connection is held while the client drains the response.
+async def export_order_chunks(sql: str, params: list):
+    cursor = None
+    while True:
+        def query(conn):
+            return fetch_page(conn, sql, params, 'created_at', 'created_at', 'id', False, EXPORT_CHUNK_SIZE, cursor)
+
+        rows, cursor = await db_read(query)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+async def export_ndjson(chunks):
+    async for rows in chunks:
+        yield b''.join(ORDER_ENCODER.encode(row) + b'\n' for row in rows)
+
+async def export_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    async for rows in chunks:
+        writer.writerows([row[column] for column in EXPORT_CSV_COLUMNS] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+@api_router.get('/orders/export')
+async def export_orders(
+    format: str = 'ndjson',
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    status: Optional[str] = None,
+    payload = Depends(verify_admin),
+):
+    if format not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail='Invalid format, expected ndjson or csv')
+    sql, params = orders_export_query(parse_export_bound(start, 'start'), parse_export_bound(end, 'end', end=True), status)
+    chunks = export_order_chunks(sql, params)
+
+    filename = f"orders-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.{format}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"', 'Cache-Control': 'no-store'}
+    if format == 'csv':
+        return StreamingResponse(export_csv(chunks), media_type='text/csv; charset=utf-8', headers=headers)
+    return StreamingResponse(export_ndjson(chunks), media_type='application/x-ndjson', headers=headers)
 
 @api_router.get('/orders/user')
-async def get_user_orders(payload = Depends(verify_token)):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT * FROM orders WHERE customer_email = (SELECT email FROM users WHERE id = ?) ORDER BY created_at DESC',
-            (payload['user_id'],)
-        )
-        orders = [dict(row) for row in cursor.fetchall()]
-        
-        for order in orders:
-            order['items'] = json.loads(order['items'])
-        
-        return orders
+async def get_user_orders(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    payload = Depends(verify_token),
+):
+    limit = page_limit(limit, cursor)
+
+    def query(conn):
+        sql, params = user_orders_query(payload['user_id'])
+        rows, next_cursor = fetch_page(conn, sql, params, '-created_at', 'created_at', 'id', True, limit, cursor)
+        total = count_rows(conn, sql, params) if include_total else None
+        return ORDER_ENCODER.encode_list(rows), page_headers(next_cursor, total)
+
+    body, headers = await db_read(query)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+# Image Routes
+IMAGE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def store_original(data: bytes):
+    ext = sniff_image_type(data)
+    if ext is None:
+        raise HTTPException(status_code=400, detail='Unsupported image type, expected JPEG, PNG, GIF or WebP')
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.verify()
+        except Exception:
+            raise HTTPException(status_code=400, detail='Image file is damaged or unreadable')
+    digest = hashlib.sha256(data).hexdigest()
+    original = find_original(digest)
+    if original is None:
+        original = image_dir(digest) / f'original.{ext}'
+        write_file_atomic(original, data)
+    return digest, original
+
+def image_url(request: Request, digest: str, filename: str) -> str:
+    if IMAGE_BASE_URL:
+        return f'{IMAGE_BASE_URL}/api/images/{digest}/{filename}'
+    return str(request.url_for('get_image', digest=digest, filename=filename))
+
+@api_router.post('/images', status_code=201)
+async def upload_image(request: Request, file: UploadFile = File(...), payload = Depends(verify_admin)):
+    data = await file.read(IMAGE_MAX_BYTES + 1)
+    if len(data) > IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f'Image is larger than {IMAGE_MAX_BYTES} bytes')
+
+    loop = asyncio.get_running_loop()
+    digest, original = await loop.run_in_executor(None, store_original, data)
+    image_processor.ensure(digest, original)
+
+    variant_names = list(image_processor.variants) if image_processor.enabled else []
+    return {
+        'id': digest,
+        'original': image_url(request, digest, original.name),
+        'variants': {name: image_url(request, digest, f'{name}.webp') for name in variant_names},
+    }
+
+@api_router.get('/images/{digest}/{filename}', name='get_image')
+async def get_image(digest: str, filename: str):
+    name, _, ext = filename.partition('.')
+    valid = re.fullmatch(r'[0-9a-f]{64}', digest) and (
+        (name == 'original' and ext in IMAGE_EXTENSIONS) or
+        (name in image_processor.variants and ext == 'webp')
+    )
+    if not valid:
+        raise HTTPException(status_code=404, detail='Image not found')
+
+    path = image_dir(digest) / filename
+    if path.is_file():
+        return FileResponse(path, headers={'Cache-Control': IMAGE_CACHE_CONTROL})
+
+    original = find_original(digest)
+    if original is None or name == 'original':
+        raise HTTPException(status_code=404, detail='Image not found')
+    # Variant not rendered yet (or Pillow isn't installed): serve the original
+    # for now, and make sure it is on its way
+    image_processor.ensure(digest, original)
+    return FileResponse(original, headers={'Cache-Control': 'no-cache'})
 
 # Favorites Routes
 @api_router.get('/favorites')
-async def get_favorites(payload = Depends(verify_token)):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            '''SELECT p.* FROM products p
-               JOIN favorites f ON p.id = f.product_id
-               WHERE f.user_id = ?
-               ORDER BY f.created_at DESC''',
-            (payload['user_id'],)
-        )
-        products = [dict(row) for row in cursor.fetchall()]
-        
-        for p in products:
-            if p['specs']:
-                p['specs'] = json.loads(p['specs'])
-        
-        return products
+async def get_favorites(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
+    payload = Depends(verify_token),
+):
+    selected = parse_fields(fields)
+    limit = page_limit(limit, cursor)
+
+    def query(conn):
+        sql, params = favorites_query(selected, payload['user_id'])
+        rows, next_cursor = fetch_page(conn, sql, params, '-created_at', 'f.created_at', 'f.id', True, limit, cursor)
+        total = count_rows(conn, sql, params) if include_total else None
+        encoder = product_encoder(selected) if selected else PRODUCT_ENCODER
+        return encoder.encode_list(rows), page_headers(next_cursor, total)
+
+    body, headers = await db_read(query)
+    return Response(content=body, media_type='application/json', headers=headers)
 
 @api_router.post('/favorites/{product_id}')
 async def add_favorite(product_id: int, payload = Depends(verify_token)):
-    with get_db() as conn:
+    now = datetime.now(timezone.utc).isoformat()
+
+    def mutate(conn):
         cursor = conn.cursor()
-        now = datetime.now(timezone.utc).isoformat()
-        
         try:
             cursor.execute(
                 'INSERT INTO favorites (user_id, product_id, created_at) VALUES (?, ?, ?)',
                 (payload['user_id'], product_id, now)
             )
             conn.commit()
-            return {'message': 'Added to favorites'}
         except sqlite3.IntegrityError:
             raise HTTPException(status_code=400, detail='Already in favorites')
 
+    await db_write(mutate)
+    return {'message': 'Added to favorites'}
+
 @api_router.delete('/favorites/{product_id}')
 async def remove_favorite(product_id: int, payload = Depends(verify_token)):
-    with get_db() as conn:
+    def mutate(conn):
         cursor = conn.cursor()
         cursor.execute(
             'DELETE FROM favorites WHERE user_id = ? AND product_id = ?',
             (payload['user_id'], product_id)
         )
         conn.commit()
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail='Favorite not found')
-        
-        return {'message': 'Removed from favorites'}
+        return cursor.rowcount
+
+    if await db_write(mutate) == 0:
+        raise HTTPException(status_code=404, detail='Favorite not found')
+    
+    return {'message': 'Removed from favorites'}
 
 # About Us Routes
 @api_router.get('/about', response_model=AboutUs)
-async def get_about():
-    with get_db() as conn:
+async def get_about(request: Request):
+    def build(conn):
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM about_us ORDER BY id DESC LIMIT 1')
         about = cursor.fetchone()
@@ -706,14 +3411,16 @@ async def get_about():
         if not about:
             raise HTTPException(status_code=404, detail='About content not found')
         
-        return dict(about)
+        return model_json(ABOUT, dict(about)), {}
+
+    return await cached_json(request, ('about',), ('about_us',), build, CACHE_CONTROL['about'])
 
 @api_router.put('/about')
 async def update_about(about: AboutUsUpdate, payload = Depends(verify_admin)):
-    with get_db() as conn:
+    now = datetime.now(timezone.utc).isoformat()
+
+    def mutate(conn):
         cursor = conn.cursor()
-        now = datetime.now(timezone.utc).isoformat()
-        
         cursor.execute('SELECT id FROM about_us LIMIT 1')
         existing = cursor.fetchone()
         
@@ -729,11 +3436,193 @@ async def update_about(about: AboutUsUpdate, payload = Depends(verify_admin)):
             )
         
         conn.commit()
-        return {'message': 'About Us updated'}
+
+    await db_write(mutate)
+    await catalog_changed()
+    return {'message': 'About Us updated'}
+
+# Storefront
+# Everything the home page renders in one response. It is built from a single
+# read transaction, so the four parts always come from the same version of the
+# catalog, and then served from storefront_cache until an admin write touches
+# one of its tables.
+STOREFRONT_TABLES = ('banners', 'categories', 'products', 'about_us')
+
+def build_storefront(conn):
+    conn.execute('BEGIN')
+    try:
+        banners = conn.execute('SELECT * FROM banners WHERE is_active = 1 ORDER BY order_index').fetchall()
+        categories = conn.execute('SELECT * FROM categories ORDER BY name').fetchall()
+        sql, params = products_query(None, 'created_at', ProductFilters(featured=True))
+        featured, _ = fetch_page(conn, sql, params, '-created_at', 'created_at', 'id', True,
+                                 STOREFRONT_FEATURED_LIMIT, None)
+        about = conn.execute('SELECT * FROM about_us ORDER BY id DESC LIMIT 1').fetchone()
+    finally:
+        conn.rollback()
+    return b''.join([
+        b'{"banners":', model_json(BANNER_LIST, [dict(row) for row in banners]),
+        b',"categories":', model_json(CATEGORY_LIST, [dict(row) for row in categories]),
+        b',"featured_products":', PRODUCT_ENCODER.encode_list(featured),
+        b',"about":', model_json(OPTIONAL_ABOUT, dict(about) if about else None),
+        b'}',
+    ]), {}
+
+@api_router.get('/storefront', response_model=Storefront)
+async def get_storefront(request: Request):
+    return await cached_json(request, ('storefront',), STOREFRONT_TABLES, build_storefront,
+                             CACHE_CONTROL['storefront'], cache=storefront_cache)
+
+# Admin diagnostics
+@api_router.get('/admin/stats/db')
+async def get_db_stats(payload = Depends(verify_admin)):
+    return {'pool': db_pool.stats()}
+
+@api_router.get('/admin/stats/cache')
+async def get_cache_stats(payload = Depends(verify_admin)):
+    return {'catalog': catalog_cache.stats(), 'storefront': storefront_cache.stats(), 'sync': catalog_sync.stats()}
+
+@api_router.get('/admin/stats/auth')
+async def get_auth_stats(payload = Depends(verify_admin)):
+    return {
+        'password_hashing': password_hasher.stats(),
+        'admin_roster': admin_roster.stats(),
+        'token_cache': token_cache.stats(),
+    }
+
+@api_router.get('/admin/stats/images')
+async def get_image_stats(payload = Depends(verify_admin)):
+    return image_processor.stats()
+
+# Prometheus metrics
+# Figures the pool, caches and hashing pool already keep, read per scrape
+metrics.gauge('db_pool_connections', 'Pooled read connections', ('state',))
+metrics.counter('db_pool_checkouts_total', 'Read connections handed out')
+metrics.counter('db_pool_waits_total', 'Checkouts that had to wait for a connection to be returned')
+metrics.counter('db_pool_wait_seconds_total', 'Time spent waiting for a connection to be returned')
+metrics.gauge('cache_entries', 'Responses or tokens currently cached', ('cache',))
+metrics.counter('cache_lookups_total', 'Cache lookups, by result', ('cache', 'result'))
+metrics.counter('cache_evictions_total', 'Entries evicted to make room', ('cache',))
+metrics.counter('cache_expirations_total', 'Entries dropped when found past their TTL', ('cache',))
+metrics.counter('cache_invalidations_total', 'Entries dropped after a catalog change', ('cache',))
+metrics.counter('catalog_sync_failures_total', 'Failed checks for catalog changes')
+metrics.gauge('password_hash_pending', 'bcrypt operations queued or running')
+metrics.counter('password_hash_rejected_total', 'bcrypt operations refused with 503 because the queue was full')
+
+@metrics.collector
+def collect_stats():
+    pool = db_pool.stats()
+    yield 'db_pool_connections', ('in_use',), pool['in_use']
+    yield 'db_pool_connections', ('idle',), pool['idle']
+    yield 'db_pool_checkouts_total', (), pool['checkouts']
+    yield 'db_pool_waits_total', (), pool['waits']
+    yield 'db_pool_wait_seconds_total', (), pool['wait_time_total']
+    for name, cache in (('catalog', catalog_cache), ('storefront', storefront_cache), ('token', token_cache)):
+        stats = cache.stats()
+        yield 'cache_entries', (name,), stats['entries']
+        yield 'cache_lookups_total', (name, 'hit'), stats['hits']
+        yield 'cache_lookups_total', (name, 'miss'), stats['misses']
+        yield 'cache_evictions_total', (name,), stats['evictions']
+        yield 'cache_expirations_total', (name,), stats['expirations']
+        if 'invalidations' in stats:
+            yield 'cache_invalidations_total', (name,), stats['invalidations']
+    yield 'catalog_sync_failures_total', (), catalog_sync.stats()['failures']
+    hashing = password_hasher.stats()
+    yield 'password_hash_pending', (), hashing['pending']
+    yield 'password_hash_rejected_total', (), hashing['rejected']
+
+@app.get('/metrics', include_in_schema=False)
+async def get_metrics(request: Request):
+    if METRICS_TOKEN and not secrets.compare_digest(
+            request.headers.get('authorization', '').encode(), f'Bearer {METRICS_TOKEN}'.encode()):
+        raise HTTPException(status_code=401, detail='Invalid metrics token')
+    return Response(content=metrics.render(), media_type='text/plain; version=0.0.4')
 
 # Include router
 app.include_router(api_router)
 
+# Frontend
+# The build is immutable while the process runs, so it is indexed once at
+# startup: ETags, the .br/.gz siblings written by the frontend's postbuild
+# step and (for small files) the bytes themselves. A request is then a dict
+# lookup; larger files go out through FileResponse, which hands the path to
+# the server for zero-copy sending where it supports it. Fingerprinted assets
+# are cached forever, everything else revalidates.
+HASHED_ASSET = re.compile(r'\.[0-9a-f]{8,20}\.(chunk\.)?[a-z0-9]+$')
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+class StaticSite:
+    def __init__(self, root: Path, inline_max: int = FRONTEND_INLINE_MAX):
+        self.root = root
+        self.inline_max = inline_max
+        self.files = {}
+
+    def _variant(self, path: Path) -> dict:
+        stat_result = path.stat()
+        data = path.read_bytes()
+        return {
+            'path': path,
+            'stat': stat_result,
+            'etag': hashlib.blake2b(data, digest_size=12).hexdigest(),
+            'body': data if stat_result.st_size <= self.inline_max else None,
+        }
+
+    def load(self):
+        files = {}
+        for path in sorted(self.root.rglob('*')):
+            if not path.is_file() or path.suffix in ('.br', '.gz'):
+                continue
+            variants = {None: self._variant(path)}
+            for encoding, suffix in PRECOMPRESSED:
+                sibling = path.with_name(path.name + suffix)
+                # A sibling older than its source is left over from an earlier build
+                if sibling.is_file() and sibling.stat().st_mtime >= path.stat().st_mtime:
+                    variants[encoding] = self._variant(sibling)
+            relative = path.relative_to(self.root).as_posix()
+            files[relative] = {
+                'content_type': mimetypes.guess_type(path.name)[0] or 'application/octet-stream',
+                'cache_control': 'public, max-age=31536000, immutable' if HASHED_ASSET.search(path.name) else 'no-cache',
+                'variants': variants,
+            }
+        self.files = files
+        logging.info('Serving frontend from %s (%d files)', self.root, len(files))
+
+    def resolve(self, path: str) -> Optional[dict]:
+        entry = self.files.get(path.strip('/') or 'index.html')
+        # Client-side routes (no file extension) get the app shell
+        if entry is None and '.' not in path.rsplit('/', 1)[-1]:
+            entry = self.files.get('index.html')
+        return entry
+
+static_site = StaticSite(Path(FRONTEND_BUILD_DIR)) if FRONTEND_BUILD_DIR else None
+
+async def serve_frontend(request: Request, path: str):
+    entry = static_site.resolve(path) if not path.startswith('api/') else None
+    if entry is None:
+        raise HTTPException(status_code=404, detail='Not Found')
+
+    accepted = accepted_encodings(request.headers.get('accept-encoding'))
+    encoding = next((e for e, _ in PRECOMPRESSED if e in entry['variants'] and e in accepted), None)
+    variant = entry['variants'][encoding]
+
+    headers = {'ETag': f'"{variant["etag"]}"', 'Cache-Control': entry['cache_control'], 'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    if etag_matches(request.headers.get('if-none-match'), headers['ETag']):
+        return Response(status_code=304, headers=headers)
+    if variant['body'] is not None:
+        return Response(content=variant['body'], media_type=entry['content_type'], headers=headers)
+    return FileResponse(variant['path'], stat_result=variant['stat'], media_type=entry['content_type'], headers=headers)
+
+if static_site is not None:
+    # Registered after the API so it only sees paths nothing else matched
+    app.add_api_route('/{path:path}', serve_frontend, methods=['GET', 'HEAD'], include_in_schema=False)
+
+# Compression, inside CORS
+app.add_middleware(CompressionMiddleware)
+
+if SQL_PROFILE != 'off':
+    app.add_middleware(QueryProfileMiddleware)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -741,8 +3630,12 @@ app.add_middleware(
     allow_origins=['*'],
     allow_methods=['*'],
     allow_headers=['*'],
+    expose_headers=['X-Next-Cursor', 'X-Total-Count', 'ETag', 'X-Query-Count', 'Server-Timing'],
 )
 
+# Metrics, outside everything else
+app.add_middleware(MetricsMiddleware)
+
 # Logging
 logging.basicConfig(
     level=logging.INFO,
@@ -752,9 +3645,203 @@ logging.basicConfig(
 # Initialize database on startup
 @app.on_event('startup')
 async def startup():
-    init_db()
-    logging.info('Database initialized')
+    # Workers started by the launcher below find the database already prepared
+    # and audited by their supervisor
+    if not os.environ.get(DB_PREPARED_ENV):
+        prepare_database()
+        logging.info('Database schema at version %d', SCHEMA_VERSION)
+        run_query_plan_audit()
+    if static_site is not None:
+        static_site.load()
+    password_hasher.start()
+    admin_roster.start()
+    catalog_sync.start()
+    metrics.start()
+    if Image is None:
+        logging.warning('Pillow is not installed: uploaded images are served without resized variants')
+
+@app.on_event('shutdown')
+async def shutdown():
+    admin_roster.stop()
+    catalog_sync.stop()
+    password_hasher.shutdown()
+    image_processor.shutdown()
+    db_read_executor.shutdown(wait=True)
+    db_write_executor.shutdown(wait=True)
+    db_pool.close()
+    metrics.stop()
+
+def rebuild_search_command(args) -> int:
+    prepare_database()
+    with get_write_db() as conn:
+        indexed = rebuild_search_index(conn)
+    print(f'Search index rebuilt with {indexed} products')
+    return 0
+
+def migrate_command(args) -> int:
+    if args.dry_run:
+        with get_db() as conn:
+            current, pending = schema_version(conn), pending_migrations(conn)
+        print(f'Schema version {current}, latest {SCHEMA_VERSION}')
+        for migration in pending:
+            backfill = ' (with backfill)' if migration.backfill else ''
+            print(f'  pending {migration.version}: {migration.description}{backfill}')
+        return 0
+    for migration in prepare_database():
+        print(f'Applied {migration.version}: {migration.description}')
+    print(f'Schema is at version {SCHEMA_VERSION}')
+    return 0
+
+def audit_queries_command(args) -> int:
+    prepare_database()
+    report = run_query_plan_audit('warn')
+    for entry in report:
+        print(f"[{entry['status']}] {entry['name']}")
+        for detail in entry['plan']:
+            print(f'    {detail}')
+    failures = [e for e in report if e['status'] == 'full-scan']
+    print(f'{len(report)} queries audited, {len(failures)} full table scans')
+    return 1 if failures else 0
+
+# Multi-worker launcher
+# With WEB_CONCURRENCY > 1 the `python server.py` process becomes a small
+# supervisor: it prepares the database once, binds the listening socket and
+# hands it to that many worker processes, which accept on it in parallel and
+# share the SQLite file through WAL. A worker that dies is replaced. SIGHUP
+# replaces the workers one at a time, each new one serving before its
+# predecessor is told to drain, so a restart drops no requests; SIGTERM and
+# SIGINT drain them all and exit.
+DB_PREPARED_ENV = 'BAAJE_DB_PREPARED'
+WORKER_START_TIMEOUT = 60
+
+def serve_worker(sock, ready):
+    import uvicorn
+
+    # Out of the terminal's process group: Ctrl-C reaches only the supervisor,
+    # which then stops each worker exactly once
+    os.setpgrp()
+
+    class Server(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            if self.started:
+                ready.set()
+
+        async def shutdown(self, sockets=None):
+            # Stop accepting, then give connections accepted a moment ago time
+            # to send their request: uvicorn closes idle ones outright, which
+            # resets a client whose request was already on the wire
+            for server in self.servers:
+                server.close()
+            await asyncio.sleep(0.5)
+            await super().shutdown(sockets=sockets)
+
+    config = uvicorn.Config('server:app', timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT)
+    Server(config).run(sockets=[sock])
+
+class WorkerSupervisor:
+    def __init__(self, workers: int = WEB_CONCURRENCY):
+        self.count = workers
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = []
+        self.should_exit = threading.Event()
+        self.should_restart = threading.Event()
+
+    def spawn(self, sock):
+        ready = self.context.Event()
+        process = self.context.Process(target=serve_worker, args=(sock, ready), name='server-worker')
+        process.start()
+        return process, ready
+
+    def stop(self, *processes):
+        # One SIGTERM each: uvicorn treats a second one as "exit now"
+        for process in processes:
+            process.terminate()
+        deadline = time.monotonic() + GRACEFUL_SHUTDOWN_TIMEOUT + 5
+        for process in processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logging.warning('Worker %s did not drain in time, killing it', process.pid)
+                process.kill()
+                process.join()
+
+    def wait_ready(self, process, ready) -> bool:
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        while not ready.wait(0.5):
+            if not process.is_alive() or self.should_exit.is_set() or time.monotonic() > deadline:
+                return False
+        return True
+
+    def restart(self, sock):
+        for index, (old, _) in enumerate(list(self.workers)):
+            process, ready = self.spawn(sock)
+            if not self.wait_ready(process, ready):
+                if not self.should_exit.is_set():
+                    logging.error('Replacement worker failed to start, keeping the running workers')
+                self.stop(process)
+                return
+            self.workers[index] = (process, ready)
+            self.stop(old)
+        logging.info('Restarted %d workers', len(self.workers))
+
+    def run(self, host: str = HOST, port: int = PORT) -> int:
+        import uvicorn
+
+        prepare_database()
+        report = run_query_plan_audit()
+        db_pool.close()
+        os.environ[DB_PREPARED_ENV] = '1'
+        logging.info('Database schema at version %d, %d queries audited', SCHEMA_VERSION, len(report))
+
+        # Where the workers publish their metrics, so any one of them can
+        # answer a scrape for all; a fresh one per run
+        metrics_dir = METRICS_DIR or tempfile.mkdtemp(prefix='baaje-metrics-')
+        for stale in Path(metrics_dir).glob('*.json'):
+            stale.unlink()
+        os.environ['METRICS_DIR'] = metrics_dir
+
+        sock = uvicorn.Config('server:app', host=host, port=port).bind_socket()
+        signal.signal(signal.SIGTERM, lambda *_: self.should_exit.set())
+        signal.signal(signal.SIGINT, lambda *_: self.should_exit.set())
+        signal.signal(signal.SIGHUP, lambda *_: self.should_restart.set())
+
+        self.workers = [self.spawn(sock) for _ in range(self.count)]
+        logging.info('Started %d workers (supervisor pid %d)', self.count, os.getpid())
+        while not self.should_exit.wait(0.5):
+            if self.should_restart.is_set():
+                self.should_restart.clear()
+                self.restart(sock)
+            for index, (process, _) in enumerate(self.workers):
+                if not process.is_alive() and not self.should_exit.is_set():
+                    logging.warning('Worker %s exited with code %s, starting a new one', process.pid, process.exitcode)
+                    self.workers[index] = self.spawn(sock)
+
+        logging.info('Stopping %d workers', len(self.workers))
+        self.stop(*(process for process, _ in self.workers))
+        self.workers = []
+        sock.close()
+        if not METRICS_DIR:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+        return 0
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Baaje Electronics API server')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('audit-queries', help='EXPLAIN QUERY PLAN every query the API issues')
+    commands.add_parser('rebuild-search', help='Rebuild the product full-text search index')
+    migrate_parser = commands.add_parser('migrate', help='Apply pending schema migrations')
+    migrate_parser.add_argument('--dry-run', action='store_true', help='List pending migrations without applying them')
+    args = parser.parse_args()
+
+    if args.command == 'audit-queries':
+        sys.exit(audit_queries_command(args))
+    if args.command == 'rebuild-search':
+        sys.exit(rebuild_search_command(args))
+    if args.command == 'migrate':
+        sys.exit(migrate_command(args))
+
+    if WEB_CONCURRENCY > 1 and fcntl is not None:
+        sys.exit(WorkerSupervisor().run())
+
     import uvicorn
-    uvicorn.run("server:app", host=HOST, port=PORT, reload=False)
+    uvicorn.run("server:app", host=HOST, port=PORT, reload=False, timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT)
@@ -3,6 +3,7 @@
 import requests
 import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 class BaajeElectronicsAPITester:
@@ -294,6 +295,63 @@ class BaajeElectronicsAPITester:
                 headers={"Authorization": f"Bearer {self.user_token}"}
             )
 
+    def test_concurrent_checkout(self, stock=10, buyers=50):
+        """Concurrent checkouts must never sell more than the stock"""
+        print("\n🏁 Testing Concurrent Checkout...")
+        
+        if not self.admin_token:
+            self.log_test("Concurrent Checkout", False, "Admin token required")
+            return
+        
+        admin_headers = {"Authorization": f"Bearer {self.admin_token}"}
+        success, product = self.run_test(
+            "Create Stress Test Product (Admin)",
+            "POST",
+            "/products",
+            200,
+            data={
+                "name": "Checkout Stress Test",
+                "description": "Temporary product for the concurrent checkout test",
+                "price": 100.0,
+                "category_id": 1,
+                "image_url": "https://example.com/test.jpg",
+                "stock": stock,
+                "is_featured": False,
+                "specs": {}
+            },
+            headers=admin_headers
+        )
+        if not success:
+            return
+        
+        order = {
+            "customer_name": "Stress Test",
+            "customer_email": "stress@example.com",
+            "customer_phone": "9812345678",
+            "customer_location": "Kathmandu",
+            "items": [{"id": product["id"], "quantity": 1}]
+        }
+        
+        def checkout(_):
+            try:
+                return requests.post(f"{self.api_url}/orders", json=order, timeout=30).status_code
+            except Exception:
+                return None
+        
+        with ThreadPoolExecutor(max_workers=buyers) as executor:
+            statuses = list(executor.map(checkout, range(buyers)))
+        
+        sold = statuses.count(200)
+        rejected = statuses.count(409)
+        remaining = requests.get(f"{self.api_url}/products/{product['id']}", timeout=10).json().get("stock")
+        self.log_test(
+            "Concurrent Checkout Never Oversells",
+            sold == stock and rejected == buyers - stock and remaining == 0,
+            f"{buyers} buyers, stock {stock}: {sold} sold, {rejected} rejected, {remaining} left"
+        )
+        
+        requests.delete(f"{self.api_url}/products/{product['id']}", headers=admin_headers, timeout=10)
+
     def test_favorites_api(self):
         """Test favorites API"""
         print("\n❤️ Testing Favorites API...")
@@ -368,6 +426,7 @@ class BaajeElectronicsAPITester:
         self.test_categories_api()
         self.test_banners_api()
         self.test_orders_api()
+        self.test_concurrent_checkout()
         self.test_favorites_api()
         self.test_about_api()
         
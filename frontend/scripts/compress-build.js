@@ -0,0 +1,59 @@
+// Writes .br and .gz siblings next to every compressible file in build/ so
+// the backend (FRONTEND_BUILD_DIR) can send them without compressing on the fly.
+const fs = require("fs");
+const path = require("path");
+const zlib = require("zlib");
+
+const BUILD_DIR = path.resolve(__dirname, "..", "build");
+const COMPRESSIBLE = /\.(html|js|mjs|css|json|map|svg|txt|xml|ico|webmanifest)$/i;
+const MIN_SIZE = 1024;
+
+function* walk(dir) {
+  for (const entry of fs.readdirSync(dir, { withFileTypes: true })) {
+    const full = path.join(dir, entry.name);
+    if (entry.isDirectory()) {
+      yield* walk(full);
+    } else {
+      yield full;
+    }
+  }
+}
+
+function writeIfSmaller(target, compressed, originalSize) {
+  // Not worth a sibling if compression doesn't actually save anything
+  if (compressed.length < originalSize) {
+    fs.writeFileSync(target, compressed);
+    return compressed.length;
+  }
+  return 0;
+}
+
+if (!fs.existsSync(BUILD_DIR)) {
+  console.error(`No build directory at ${BUILD_DIR}`);
+  process.exit(1);
+}
+
+let files = 0;
+let before = 0;
+let after = 0;
+for (const file of walk(BUILD_DIR)) {
+  if (!COMPRESSIBLE.test(file)) continue;
+  const data = fs.readFileSync(file);
+  if (data.length < MIN_SIZE) continue;
+
+  const brotli = zlib.brotliCompressSync(data, {
+    params: {
+      [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+      [zlib.constants.BROTLI_PARAM_SIZE_HINT]: data.length,
+    },
+  });
+  const gzip = zlib.gzipSync(data, { level: zlib.constants.Z_BEST_COMPRESSION });
+  const brSize = writeIfSmaller(`${file}.br`, brotli, data.length);
+  writeIfSmaller(`${file}.gz`, gzip, data.length);
+
+  files += 1;
+  before += data.length;
+  after += brSize || data.length;
+}
+
+console.log(`Precompressed ${files} files: ${(before / 1024).toFixed(0)} KiB -> ${(after / 1024).toFixed(0)} KiB (brotli)`);
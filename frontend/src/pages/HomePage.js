@@ -33,16 +33,15 @@ const HomePage = ({ addToCart, user, onOpenAuth }) => {
 
   const fetchData = async () => {
     try {
-      const [bannersRes, categoriesRes, productsRes] = await Promise.all([
-        axios.get(`${API}/banners?active_only=true`),
-        axios.get(`${API}/categories`),
+      const [storefrontRes, productsRes] = await Promise.all([
+        axios.get(`${API}/storefront`),
         axios.get(`${API}/products`)
       ]);
 
-      setBanners(bannersRes.data);
-      setCategories(categoriesRes.data);
+      setBanners(storefrontRes.data.banners);
+      setCategories(storefrontRes.data.categories);
+      setFeaturedProducts(storefrontRes.data.featured_products);
       setAllProducts(productsRes.data);
-      setFeaturedProducts(productsRes.data.filter(p => p.is_featured));
     } catch (error) {
       console.error('Error fetching data:', error);
       toast.error('Failed to load data');
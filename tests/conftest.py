@@ -0,0 +1,43 @@
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# server reads its configuration at import time, so point it at a scratch
+# database and upload directory before any test imports it
+SCRATCH = tempfile.mkdtemp(prefix='baaje-tests-')
+os.environ['DB_PATH'] = os.path.join(SCRATCH, 'test.db')
+os.environ['UPLOAD_DIR'] = os.path.join(SCRATCH, 'uploads')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+
+@pytest.fixture(scope='session')
+def client():
+    from fastapi.testclient import TestClient
+    import server
+
+    with TestClient(server.app) as test_client:
+        yield test_client
+    shutil.rmtree(SCRATCH, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def admin_headers(client):
+    response = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 200, response.text
+    return {'Authorization': f"Bearer {response.json()['token']}"}
+
+
+@pytest.fixture
+def make_product(client, admin_headers):
+    def make(price: float = 100.0, stock: int = 10, name: str = 'Test product'):
+        response = client.post('/api/products', headers=admin_headers, json={
+            'name': name, 'description': 'Created by the test suite', 'price': price, 'category_id': 1,
+            'image_url': 'https://example.com/test.jpg', 'specs': {}, 'stock': stock, 'is_featured': False,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()['id']
+    return make
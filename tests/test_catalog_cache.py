@@ -0,0 +1,58 @@
+import server
+
+
+def test_catalog_responses_revalidate_on_every_use(client):
+    for path in ['/api/products', '/api/categories', '/api/banners', '/api/about', '/api/storefront']:
+        response = client.get(path)
+        assert response.status_code == 200, path
+        assert 'no-cache' in response.headers['cache-control'], path
+        assert 'max-age' not in response.headers['cache-control'], path
+
+
+def test_admin_edit_shows_on_revalidation(client, admin_headers):
+    created = client.post('/api/categories', headers=admin_headers, json={'name': 'Cache test'})
+    assert created.status_code == 200, created.text
+    category_id = created.json()['id']
+    before = client.get('/api/categories')
+    assert client.get('/api/categories', headers={'If-None-Match': before.headers['etag']}).status_code == 304
+
+    renamed = client.put(f'/api/categories/{category_id}', headers=admin_headers, json={'name': 'Cache test renamed'})
+    assert renamed.status_code == 200, renamed.text
+
+    after = client.get('/api/categories', headers={'If-None-Match': before.headers['etag']})
+    assert after.status_code == 200
+    assert 'Cache test renamed' in [category['name'] for category in after.json()]
+
+
+def test_write_from_another_process_is_served_at_once(client, admin_headers):
+    created = client.post('/api/categories', headers=admin_headers, json={'name': 'Other worker'})
+    category_id = created.json()['id']
+    before = client.get('/api/categories')
+
+    # As another worker would: straight to the database, bypassing this one's caches
+    with server.get_db() as conn:
+        conn.execute('UPDATE categories SET name = ? WHERE id = ?', ('Other worker renamed', category_id))
+        conn.commit()
+
+    after = client.get('/api/categories', headers={'If-None-Match': before.headers['etag']})
+    assert after.status_code == 200
+    assert after.headers['etag'] != before.headers['etag']
+    assert 'Other worker renamed' in [category['name'] for category in after.json()]
+
+
+def catalog_versions() -> dict:
+    with server.get_db() as conn:
+        return dict(conn.execute('SELECT tag, version FROM catalog_version').fetchall())
+
+
+def test_stock_changes_leave_catalog_versions_alone(client, make_product):
+    product = make_product(stock=5)
+    before = catalog_versions()
+
+    response = client.post('/api/orders', json={
+        'customer_name': 'Test Customer', 'customer_email': 'customer@example.com',
+        'customer_phone': '9800000000', 'customer_location': 'Kathmandu', 'items': [{'id': product, 'quantity': 1}],
+    })
+
+    assert response.status_code == 200, response.text
+    assert catalog_versions() == before
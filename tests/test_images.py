@@ -0,0 +1,31 @@
+from urllib.parse import urlsplit
+
+# A 4x4 lossless WebP
+WEBP = b'RIFF\x1e\x00\x00\x00WEBPVP8L\x11\x00\x00\x00/\x03\xc0\x00\x00\x07P\x8f"\xd7\xa3\xff\x81\x88\xe8\x7f\x00\x00'
+
+
+def path_of(url: str) -> str:
+    return urlsplit(url).path
+
+
+def test_webp_upload_can_be_fetched_back(client, admin_headers):
+    response = client.post('/api/images', headers=admin_headers, files={'file': ('photo.webp', WEBP, 'image/webp')})
+    assert response.status_code == 201, response.text
+    uploaded = response.json()
+    assert path_of(uploaded['original']).endswith('/original.webp')
+
+    original = client.get(path_of(uploaded['original']))
+    assert original.status_code == 200
+    assert original.content == WEBP
+
+    # A variant is either rendered already or falls back to the original
+    for url in uploaded['variants'].values():
+        assert client.get(path_of(url)).status_code == 200
+
+
+def test_unknown_original_extension_is_not_served(client, admin_headers):
+    response = client.post('/api/images', headers=admin_headers, files={'file': ('photo.webp', WEBP, 'image/webp')})
+    assert response.status_code == 201, response.text
+    digest = response.json()['id']
+
+    assert client.get(f'/api/images/{digest}/original.bmp').status_code == 404
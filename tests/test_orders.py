@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import server
+
+CUSTOMER = {
+    'customer_name': 'Test Customer',
+    'customer_email': 'customer@example.com',
+    'customer_phone': '9800000000',
+    'customer_location': 'Kathmandu',
+}
+
+
+def place_order(client, *items, **extra):
+    return client.post('/api/orders', json={**CUSTOMER, 'items': list(items), **extra})
+
+
+def stock_of(product_id: int) -> int:
+    # Straight from the database: catalog responses may serve stock from cache
+    with server.get_db() as conn:
+        return conn.execute('SELECT stock FROM products WHERE id = ?', (product_id,)).fetchone()[0]
+
+
+def test_order_is_priced_from_products(client, make_product):
+    fan = make_product(price=250.0, stock=10)
+    bulb = make_product(price=35.5, stock=10)
+
+    # Client-sent prices and totals are ignored
+    response = place_order(client, {'id': fan, 'quantity': 2, 'price': 1}, {'id': bulb, 'quantity': 1},
+                           {'id': fan, 'quantity': 1}, total_amount=1)
+
+    assert response.status_code == 200, response.text
+    assert response.json()['total_amount'] == 785.5
+    with server.get_db() as conn:
+        lines = conn.execute('SELECT product_id, unit_price, quantity FROM order_items WHERE order_id = ? '
+                             'ORDER BY product_id', (response.json()['id'],)).fetchall()
+    assert [tuple(line) for line in lines] == [(fan, 250.0, 3), (bulb, 35.5, 1)]
+    assert stock_of(fan) == 7
+    assert stock_of(bulb) == 9
+
+
+def test_order_over_stock_is_rejected(client, make_product):
+    product = make_product(stock=2)
+
+    response = place_order(client, {'id': product, 'quantity': 3})
+
+    assert response.status_code == 409
+    assert stock_of(product) == 2
+
+
+def test_order_for_unknown_product_is_rejected(client, make_product):
+    product = make_product(stock=5)
+
+    response = place_order(client, {'id': product, 'quantity': 1}, {'id': 10 ** 9, 'quantity': 1})
+
+    assert response.status_code == 400
+    assert stock_of(product) == 5
+
+
+def test_concurrent_checkouts_never_oversell(client, make_product):
+    product = make_product(stock=10)
+
+    with ThreadPoolExecutor(16) as pool:
+        statuses = list(pool.map(lambda _: place_order(client, {'id': product, 'quantity': 1}).status_code, range(40)))
+
+    assert statuses.count(200) == 10
+    assert statuses.count(409) == 30
+    assert stock_of(product) == 0
@@ -0,0 +1,52 @@
+import base64
+import json
+
+import pytest
+
+
+def encode(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('cursor', [
+    encode(['-created_at', [1], 1]),
+    encode(['-created_at', {'a': 1}, 1]),
+    encode(['-created_at', None, 1]),
+    encode(['-created_at', True, 1]),
+    encode(['-created_at', 10 ** 30, 1]),
+    encode(['-created_at', '2030-01-01', 2 ** 63]),
+    encode(['-created_at', '2030-01-01', True]),
+    encode(['-created_at', '2030-01-01', 1.5]),
+    base64.urlsafe_b64encode(b'["-created_at", Infinity, 1]').decode(),
+    base64.urlsafe_b64encode(b'["-created_at", NaN, 1]').decode(),
+    'not-a-cursor',
+])
+def test_malformed_cursor_is_rejected(client, cursor):
+    response = client.get('/api/products', params={'limit': 2, 'cursor': cursor})
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Invalid cursor'
+
+
+def test_cursor_for_another_sort_is_rejected(client):
+    first = client.get('/api/products', params={'limit': 2, 'sort': 'price'})
+
+    response = client.get('/api/products', params={'limit': 2, 'sort': 'name', 'cursor': first.headers['x-next-cursor']})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('sort', ['-created_at', 'price', '-price', 'name'])
+def test_cursor_pages_through_every_product(client, sort):
+    everything = client.get('/api/products').json()
+    seen, cursor = [], None
+    while True:
+        params = {'sort': sort, 'limit': 3, **({'cursor': cursor} if cursor else {})}
+        response = client.get('/api/products', params=params)
+        assert response.status_code == 200, response.text
+        seen += [product['id'] for product in response.json()]
+        cursor = response.headers.get('x-next-cursor')
+        if not cursor:
+            break
+
+    assert sorted(seen) == sorted(product['id'] for product in everything)